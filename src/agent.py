@@ -4,17 +4,36 @@ A proof-of-concept agent that takes prompts, creates plans, and executes them
 using sub-agents and MCP connections.
 """
 
+import asyncio
 import json
 import os
-from typing import List, Dict, Any, Optional
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Dict, Any, Optional, Tuple
+from llm_cache import LLMCache
+from logger import setup_logger
 from planner import Planner
 from mcp_client import MCPClient
+from rate_limiter import RateLimiter
 from sub_agent import SubAgent
+from tool_index import ToolIndex
+
+logger = setup_logger()
+
+# The OpenAI SDK is imported lazily (see planner.py); prefetch it on a
+# background thread so the import overlaps MCP connections and argument
+# handling instead of stalling the first client construction.
+threading.Thread(target=lambda: __import__("openai"), daemon=True).start()
 
 
 class Agent:
     """Main agent that coordinates planning and execution."""
-    
+
+    # Occurrences of the same plan shape before it is compiled to a
+    # specialized runner (see _compile_plan)
+    PLAN_COMPILE_THRESHOLD = 3
+
+
     def __init__(self, api_key: Optional[str] = None, model: str = "gpt-4o-mini"):
         """
         Initialize the agent.
@@ -28,26 +47,118 @@ class Agent:
             raise ValueError("OpenAI API key required. Set OPENAI_API_KEY env var or pass api_key parameter.")
         
         self.model = model
-        self.planner = Planner(self.api_key, self.model)
+        # One limiter shared by the planner and every sub-agent so the
+        # whole agent stays under the account's RPM/TPM budget
+        self.rate_limiter = RateLimiter()
+        # One exact-match cache shared by the planner and sub-agent.
+        # Setting AGENT_CACHE_DIR backs it with a diskcache store so hits
+        # survive across processes (CI runs, repeated CLI invocations);
+        # otherwise it stays in-memory and dies with the agent.
+        cache_dir = os.getenv("AGENT_CACHE_DIR")
+        if cache_dir:
+            self.llm_cache = LLMCache.persistent(os.path.expanduser(cache_dir))
+        else:
+            self.llm_cache = LLMCache()
+        self.planner = Planner(self.api_key, self.model,
+                               llm_cache=self.llm_cache,
+                               rate_limiter=self.rate_limiter)
+        # The planner's client is shared with every sub-agent so all LLM
+        # calls reuse one HTTP connection pool instead of paying TLS setup
+        # per component
+        self.openai_client = self.planner.client
         self.mcp_clients: Dict[str, MCPClient] = {}
-        self.sub_agents: List[SubAgent] = []
+        # SubAgent is stateless apart from its client, so one pooled
+        # instance serves every step regardless of plan length
+        self.sub_agent = SubAgent(self.api_key, self.model,
+                                  cache=self.llm_cache,
+                                  rate_limiter=self.rate_limiter,
+                                  openai_client=self.openai_client)
+        # Tool catalog cache, invalidated whenever connections change
+        self._tools_catalog_cache: Optional[List[Dict[str, Any]]] = None
+        self._tools_version = 0
+        # Precomputed catalog view (fingerprint, parallel arrays) rebuilt
+        # only when connections change, so planning never re-hashes tools
+        self.tool_index = ToolIndex()
+        # Compiled runners for frequently repeated plan shapes, dropped
+        # whenever connections change since they hard-code server names
+        self._plan_shape_counts: Dict[tuple, int] = {}
+        self._compiled: Dict[tuple, Any] = {}
         
-    def connect_mcp(self, name: str, server_path: str, args: List[str] = None):
+    def connect_mcp(self, name: str, server_path: str, args: List[str] = None,
+                    max_concurrency: int = 4):
         """
         Connect to an MCP server.
-        
+
         Args:
             name: Name identifier for this MCP connection
             server_path: Path to the MCP server executable
             args: Optional arguments for the MCP server
+            max_concurrency: Ceiling on overlapping async tool calls to
+                this server (adaptively reduced when the server lags)
         """
-        client = MCPClient(server_path, args or [])
+        client = MCPClient(server_path, args or [], max_concurrency=max_concurrency)
         client.connect()
         self.mcp_clients[name] = client
-        print(f"✓ Connected to MCP server: {name}")
+        self._invalidate_tools_cache()
+        logger.info(f"✓ Connected to MCP server: {name}")
+
+    def connect_mcp_all(self, servers: List[Tuple[str, str, Optional[List[str]]]],
+                        max_concurrency: int = 4):
+        """
+        Connect to several MCP servers concurrently.
+
+        Server startup is I/O-bound, so K servers boot in roughly the time
+        of the slowest one instead of sequentially. A server that fails to
+        start is logged and skipped; the others stay connected.
+
+        Args:
+            servers: (name, server_path, args) tuples
+            max_concurrency: Ceiling on overlapping async tool calls per
+                server, as in connect_mcp
+        """
+        if not servers:
+            return
+
+        def _connect(entry):
+            name, server_path, args = entry
+            client = MCPClient(server_path, args or [],
+                               max_concurrency=max_concurrency)
+            client.connect()
+            return name, client
+
+        with ThreadPoolExecutor(max_workers=len(servers)) as pool:
+            futures = {pool.submit(_connect, entry): entry[0]
+                       for entry in servers}
+            # Consume every future so one failed server neither strands
+            # the clients that did connect nor skips cache invalidation
+            for future in as_completed(futures):
+                name = futures[future]
+                try:
+                    name, client = future.result()
+                except Exception as e:
+                    logger.warning(f"Could not connect to MCP server {name}: {e}")
+                    continue
+                self.mcp_clients[name] = client
+                logger.info(f"✓ Connected to MCP server: {name}")
+
+        self._invalidate_tools_cache()
+
+    def _invalidate_tools_cache(self):
+        """Drop the cached tool catalog after a connection change."""
+        self._tools_catalog_cache = None
+        self._tools_version += 1
+        self._compiled.clear()
         
     def get_available_tools(self) -> List[Dict[str, Any]]:
-        """Get all available tools from connected MCP servers."""
+        """
+        Get all available tools from connected MCP servers.
+
+        The aggregated catalog is cached until a server is connected or
+        disconnected, so repeated runs skip the per-server RPCs.
+        """
+        if self._tools_catalog_cache is not None:
+            return self._tools_catalog_cache
+
         tools = []
         for name, client in self.mcp_clients.items():
             try:
@@ -56,91 +167,331 @@ class Agent:
                     tool["mcp_server"] = name
                     tools.append(tool)
             except Exception as e:
-                print(f"Warning: Could not get tools from {name}: {e}")
+                logger.warning(f"Could not get tools from {name}: {e}")
+
+        self._tools_catalog_cache = tools
+        self.tool_index.rebuild(tools)
         return tools
     
-    def execute_plan(self, plan: Dict[str, Any]) -> Dict[str, Any]:
+    def _build_levels(self, plan_steps: List[Dict[str, Any]]) -> List[List[Tuple[int, Dict[str, Any]]]]:
         """
-        Execute a plan step by step.
-        
+        Group plan steps into dependency levels.
+
+        Steps may declare a "depends_on" list of step numbers; steps in the
+        same level have no unmet dependencies and can run concurrently.
+        Steps without dependencies all land in the first level.
+
         Args:
-            plan: Plan dictionary with steps and actions
-            
+            plan_steps: List of step dictionaries from the plan
+
         Returns:
-            Execution results
+            List of levels, each a list of (step_index, step) tuples
         """
-        results = []
-        plan_steps = plan.get("steps", [])
-        
-        print(f"\n📋 Executing plan with {len(plan_steps)} steps...\n")
-        
-        for i, step in enumerate(plan_steps, 1):
-            print(f"Step {i}/{len(plan_steps)}: {step.get('action', 'Unknown')}")
-            
-            action_type = step.get("type", "")
-            action = step.get("action", "")
-            parameters = step.get("parameters", {})
-            
-            try:
-                if action_type == "mcp_tool":
-                    # Execute MCP tool
-                    mcp_server = step.get("mcp_server")
-                    if mcp_server in self.mcp_clients:
-                        result = self.mcp_clients[mcp_server].call_tool(
-                            action, parameters
-                        )
-                        results.append({
-                            "step": i,
-                            "action": action,
-                            "status": "success",
-                            "result": result
-                        })
-                        print(f"  ✓ {action} completed")
-                    else:
-                        raise ValueError(f"MCP server '{mcp_server}' not connected")
-                        
-                elif action_type == "sub_agent":
-                    # Launch sub-agent
-                    sub_agent = SubAgent(self.api_key, self.model)
-                    sub_result = sub_agent.execute_task(
-                        step.get("task_description", "")
+        remaining = list(enumerate(plan_steps, 1))
+        completed = set()
+        levels = []
+
+        while remaining:
+            ready = [
+                (i, step) for i, step in remaining
+                if all(dep in completed for dep in step.get("depends_on", []))
+            ]
+            if not ready:
+                # Circular or unknown dependency - run the rest as one level
+                # rather than dropping steps
+                ready = remaining[:]
+
+            levels.append(ready)
+            for i, step in ready:
+                completed.add(step.get("step_number", i))
+            remaining = [item for item in remaining if item not in ready]
+
+        return levels
+
+    async def _execute_step(self, step: Dict[str, Any], i: int,
+                            total: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Execute a single plan step.
+
+        Args:
+            step: Step dictionary from the plan
+            i: 1-based step index (used for result ordering)
+            total: Total number of steps, if known (streaming plans aren't)
+
+        Returns:
+            Result dictionary for this step
+        """
+        label = f"Step {i}/{total}" if total is not None else f"Step {i}"
+        logger.info(f"{label}: {step.get('action', 'Unknown')}")
+
+        action_type = step.get("type", "")
+        action = step.get("action", "")
+        parameters = step.get("parameters", {})
+
+        try:
+            if action_type == "mcp_tool":
+                # Execute MCP tool
+                mcp_server = step.get("mcp_server")
+                if mcp_server in self.mcp_clients:
+                    result = await asyncio.to_thread(
+                        self.mcp_clients[mcp_server].call_tool,
+                        action, parameters
                     )
-                    results.append({
+                    logger.info(f"  ✓ {action} completed")
+                    return {
                         "step": i,
                         "action": action,
                         "status": "success",
-                        "result": sub_result
-                    })
-                    self.sub_agents.append(sub_agent)
-                    print(f"  ✓ Sub-agent task completed")
-                    
-                elif action_type == "direct":
-                    # Direct action (can be extended)
-                    results.append({
-                        "step": i,
-                        "action": action,
-                        "status": "success",
-                        "result": f"Direct action: {action}"
-                    })
-                    print(f"  ✓ {action} completed")
-                    
+                        "result": result
+                    }
                 else:
-                    raise ValueError(f"Unknown action type: {action_type}")
-                    
-            except Exception as e:
-                results.append({
+                    raise ValueError(f"MCP server '{mcp_server}' not connected")
+
+            elif action_type == "sub_agent":
+                # Delegate to the pooled sub-agent
+                sub_result = await asyncio.to_thread(
+                    self.sub_agent.execute_task,
+                    step.get("task_description", "")
+                )
+                logger.info("  ✓ Sub-agent task completed")
+                return {
                     "step": i,
                     "action": action,
+                    "status": "success",
+                    "result": sub_result
+                }
+
+            elif action_type == "direct":
+                # Direct action (can be extended)
+                logger.info(f"  ✓ {action} completed")
+                return {
+                    "step": i,
+                    "action": action,
+                    "status": "success",
+                    "result": f"Direct action: {action}"
+                }
+
+            else:
+                raise ValueError(f"Unknown action type: {action_type}")
+
+        except Exception as e:
+            logger.error(f"  ✗ Error: {e}")
+            return {
+                "step": i,
+                "action": action,
+                "status": "error",
+                "error": str(e)
+            }
+
+    async def _execute_sub_agent_batch(self, batch: List[Tuple[int, Dict[str, Any]]],
+                                       total: int) -> List[Dict[str, Any]]:
+        """
+        Run several sub-agent steps as one batched LLM call.
+
+        Args:
+            batch: (step_index, step) tuples for the sub-agent steps
+            total: Total number of steps in the plan
+
+        Returns:
+            Result dictionaries, one per step, in batch order
+        """
+        for i, step in batch:
+            logger.info(f"Step {i}/{total}: {step.get('action', 'Unknown')}")
+
+        tasks = [step.get("task_description", "") for _, step in batch]
+
+        try:
+            task_results = await asyncio.to_thread(self.sub_agent.execute_tasks, tasks)
+            logger.info(f"  ✓ {len(batch)} sub-agent tasks completed")
+            return [
+                {
+                    "step": i,
+                    "action": step.get("action", ""),
+                    "status": "success",
+                    "result": task_result
+                }
+                for (i, step), task_result in zip(batch, task_results)
+            ]
+        except Exception as e:
+            logger.error(f"  ✗ Error: {e}")
+            return [
+                {
+                    "step": i,
+                    "action": step.get("action", ""),
                     "status": "error",
                     "error": str(e)
-                })
-                print(f"  ✗ Error: {e}")
-                
+                }
+                for i, step in batch
+            ]
+
+    @staticmethod
+    def _plan_fingerprint(plan_steps: List[Dict[str, Any]]) -> tuple:
+        """Fingerprint a plan by its step skeleton (types/actions/servers)."""
+        return tuple(
+            (step.get("type", ""), step.get("action", ""), step.get("mcp_server"))
+            for step in plan_steps
+        )
+
+    def _compile_plan(self, plan_steps: List[Dict[str, Any]]):
+        """
+        Compile a plan shape into a specialized async runner.
+
+        The generated function hard-codes each step's dispatch (server,
+        tool name, action type), so repeated executions of the same shape
+        skip the per-step type checks and dict lookups entirely. Each
+        step body carries its own try/except that records an error-result
+        dict in place — a failing step never causes completed steps to be
+        re-run — and the steps are dispatched with one asyncio.gather,
+        matching the interpreted path's concurrency for these
+        dependency-free plans. Only dependency-free plans over connected
+        servers with at most one sub_agent step qualify (the interpreted
+        path batches two or more sub-agent steps into a single LLM call,
+        which per-step codegen would undo); anything else returns None
+        and stays on the interpreted path.
+
+        Args:
+            plan_steps: Steps of the plan being compiled
+
+        Returns:
+            Awaitable runner(self, plan) -> list of step result dicts,
+            or None when the shape cannot be specialized
+        """
+        # Two or more sub-agent steps would make one execute_tasks call
+        # on the interpreted path; N per-step calls here would be slower
+        if sum(1 for step in plan_steps
+               if step.get("type") == "sub_agent") >= 2:
+            return None
+
+        lines = ["async def _run(self, plan):", "    s = plan['steps']"]
+
+        for k, step in enumerate(plan_steps):
+            if step.get("depends_on"):
+                return None
+            action_type = step.get("type", "")
+            action = step.get("action", "")
+
+            if action_type == "mcp_tool":
+                server = step.get("mcp_server")
+                if server not in self.mcp_clients:
+                    return None
+                call = (f"await asyncio.to_thread("
+                        f"self.mcp_clients[{server!r}].call_tool, {action!r}, "
+                        f"s[{k}].get('parameters', {{}}))")
+            elif action_type == "sub_agent":
+                call = (f"await asyncio.to_thread("
+                        f"self.sub_agent.execute_task, "
+                        f"s[{k}].get('task_description', ''))")
+            elif action_type == "direct":
+                call = repr(f"Direct action: {action}")
+            else:
+                return None
+
+            lines.extend([
+                f"    async def _step{k}():",
+                "        try:",
+                f"            r = {call}",
+                "        except Exception as e:",
+                f"            return {{'step': {k + 1}, 'action': {action!r}, "
+                f"'status': 'error', 'error': str(e)}}",
+                f"        return {{'step': {k + 1}, 'action': {action!r}, "
+                f"'status': 'success', 'result': r}}",
+            ])
+
+        calls = ", ".join(f"_step{k}()" for k in range(len(plan_steps)))
+        lines.append(f"    return list(await asyncio.gather({calls}))")
+
+        namespace = {"asyncio": asyncio}
+        exec(compile("\n".join(lines), "<compiled-plan>", "exec"), namespace)
+        return namespace["_run"]
+
+    async def execute_plan_async(self, plan: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Execute a plan, running independent steps concurrently.
+
+        Steps are grouped into dependency levels (see _build_levels); each
+        level is dispatched with asyncio.gather so independent I/O-bound
+        steps overlap instead of paying one round-trip per step.
+
+        Args:
+            plan: Plan dictionary with steps and actions
+
+        Returns:
+            Execution results (ordered by step number)
+        """
+        plan_steps = plan.get("steps", [])
+
+        # Shapes seen often enough get a compiled specialized runner;
+        # step failures are recorded per step inside it, never re-run
+        fingerprint = self._plan_fingerprint(plan_steps)
+        runner = self._compiled.get(fingerprint)
+        if runner is None and plan_steps:
+            count = self._plan_shape_counts.get(fingerprint, 0) + 1
+            self._plan_shape_counts[fingerprint] = count
+            if count >= self.PLAN_COMPILE_THRESHOLD:
+                runner = self._compile_plan(plan_steps)
+                if runner is not None:
+                    self._compiled[fingerprint] = runner
+
+        if runner is not None:
+            results = await runner(self, plan)
+            return {
+                "plan": plan,
+                "results": results,
+                "success": all(
+                    r.get("status") == "success" for r in results)
+            }
+
+        results: List[Optional[Dict[str, Any]]] = [None] * len(plan_steps)
+        all_ok = True
+
+        logger.info(f"\n📋 Executing plan with {len(plan_steps)} steps...\n")
+
+        for level in self._build_levels(plan_steps):
+            # Independent sub-agent steps in the same level are batched
+            # into a single LLM call
+            batch = [(i, step) for i, step in level if step.get("type") == "sub_agent"]
+            singles = [(i, step) for i, step in level if step.get("type") != "sub_agent"]
+            if len(batch) < 2:
+                singles = level
+                batch = []
+
+            coros = [self._execute_step(step, i, len(plan_steps)) for i, step in singles]
+            if batch:
+                coros.append(self._execute_sub_agent_batch(batch, len(plan_steps)))
+
+            level_results = await asyncio.gather(*coros, return_exceptions=True)
+
+            groups = [[item] for item in singles] + ([batch] if batch else [])
+            for group, result in zip(groups, level_results):
+                step_results = result if isinstance(result, list) else [result]
+                for (i, step), step_result in zip(group, step_results):
+                    if isinstance(step_result, BaseException):
+                        step_result = {
+                            "step": i,
+                            "action": step.get("action", ""),
+                            "status": "error",
+                            "error": str(step_result)
+                        }
+                    results[i - 1] = step_result
+                    all_ok = all_ok and step_result.get("status") == "success"
+
         return {
             "plan": plan,
             "results": results,
-            "success": all(r.get("status") == "success" for r in results)
+            "success": all_ok
         }
+
+    def execute_plan(self, plan: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Execute a plan step by step.
+
+        Args:
+            plan: Plan dictionary with steps and actions
+
+        Returns:
+            Execution results
+        """
+        return asyncio.run(self.execute_plan_async(plan))
     
     def run(self, prompt: str) -> Dict[str, Any]:
         """
@@ -152,22 +503,55 @@ class Agent:
         Returns:
             Complete execution results
         """
-        print(f"\n🎯 Task: {prompt}\n")
+        logger.info(f"\n🎯 Task: {prompt}\n")
         
         # Get available tools
         available_tools = self.get_available_tools()
         
         # Create plan
-        print("🧠 Creating plan...")
-        plan = self.planner.create_plan(prompt, available_tools)
+        logger.info("🧠 Creating plan...")
+        plan = self.planner.create_plan(prompt, available_tools,
+                                        tools_fingerprint=self.tool_index.fingerprint)
         
-        print(f"\n📝 Plan created:\n{json.dumps(plan, indent=2)}\n")
+        logger.info(f"\n📝 Plan created:\n{json.dumps(plan, indent=2)}\n")
         
         # Execute plan
         execution_results = self.execute_plan(plan)
         
         return execution_results
     
+    def run_stream(self, prompt: str) -> Dict[str, Any]:
+        """
+        Plan and execute in a pipeline: each step runs as soon as it
+        streams in from the planner, instead of waiting for the full plan.
+
+        Args:
+            prompt: User's task prompt
+
+        Returns:
+            Complete execution results
+        """
+        logger.info(f"\n🎯 Task: {prompt}\n")
+
+        available_tools = self.get_available_tools()
+
+        logger.info("🧠 Creating plan (streaming)...")
+
+        steps = []
+        results = []
+        all_ok = True
+        for step in self.planner.stream_plan(prompt, available_tools):
+            steps.append(step)
+            result = asyncio.run(self._execute_step(step, len(steps)))
+            results.append(result)
+            all_ok = all_ok and result.get("status") == "success"
+
+        return {
+            "plan": {"goal": prompt, "steps": steps},
+            "results": results,
+            "success": all_ok
+        }
+
     def cleanup(self):
         """Clean up resources and close connections."""
         for client in self.mcp_clients.values():
@@ -175,7 +559,8 @@ class Agent:
                 client.disconnect()
             except:
                 pass
-        print("✓ Cleaned up connections")
+        self._invalidate_tools_cache()
+        logger.info("✓ Cleaned up connections")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,89 @@
+"""
+Exact-match cache for LLM completions.
+
+Keys are a sha256 over the full request (model, system prompt, user prompt,
+temperature), so identical calls return the stored response instead of
+paying for a fresh completion.
+"""
+
+import hashlib
+import json
+import time
+from typing import Any, Optional
+
+try:
+    import diskcache
+except ImportError:
+    diskcache = None
+
+
+class LLMCache:
+    """Exact-match cache for LLM responses with a pluggable backend."""
+
+    def __init__(self, backend: Optional[Any] = None, ttl: int = 3600):
+        """
+        Initialize the cache.
+
+        Args:
+            backend: Mapping-like store with get/set semantics. Defaults to
+                an in-process dict; a diskcache.Cache or redis client with
+                the same interface can be swapped in.
+            ttl: Time-to-live for entries in seconds
+        """
+        self.backend = backend if backend is not None else {}
+        self.ttl = ttl
+
+    @classmethod
+    def persistent(cls, directory: str, ttl: int = 3600) -> "LLMCache":
+        """
+        Build a cache backed by a diskcache store at directory.
+
+        Entries survive the process, so repeated CLI invocations and CI
+        runs share hits. diskcache uses SQLite in WAL mode, so concurrent
+        agent processes can share the same directory safely.
+
+        Args:
+            directory: Directory for the on-disk store
+            ttl: Time-to-live for entries in seconds
+
+        Raises:
+            ImportError: If diskcache is not installed
+        """
+        if diskcache is None:
+            raise ImportError(
+                "Persistent caching requires diskcache. "
+                "Install it with: pip install diskcache"
+            )
+        return cls(backend=diskcache.Cache(directory), ttl=ttl)
+
+    @staticmethod
+    def make_key(model: str, system_prompt: str, user_prompt: str,
+                 temperature: float) -> str:
+        """Build a deterministic cache key for a completion request."""
+        payload = json.dumps(
+            {
+                "model": model,
+                "sys": system_prompt,
+                "user": user_prompt,
+                "t": temperature
+            },
+            sort_keys=True
+        )
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return the cached value for key, or None if missing/expired."""
+        entry = self.backend.get(key)
+        if entry is None:
+            return None
+
+        expires_at, value = entry
+        if expires_at is not None and time.time() > expires_at:
+            del self.backend[key]
+            return None
+        return value
+
+    def set(self, key: str, value: Any):
+        """Store a value under key with the configured TTL."""
+        expires_at = time.time() + self.ttl if self.ttl else None
+        self.backend[key] = (expires_at, value)
@@ -0,0 +1,54 @@
+"""
+Logging setup for the agent system.
+
+Status output goes through a QueueHandler feeding a background
+QueueListener, so logging from hot paths is a non-blocking enqueue and
+stream/file flushing happens off the calling thread.
+"""
+
+import atexit
+import logging
+import logging.handlers
+import queue
+import sys
+
+
+def setup_logger(name: str = "agent", level: int = logging.INFO,
+                 log_file: str = None) -> logging.Logger:
+    """
+    Get the shared agent logger, configuring it on first use.
+
+    Args:
+        name: Logger name (modules share the default "agent" logger)
+        level: Logging level
+        log_file: Optional path for an additional log file
+
+    Returns:
+        Configured logger
+    """
+    logger = logging.getLogger(name)
+    if logger.handlers:
+        return logger
+
+    logger.setLevel(level)
+    logger.propagate = False
+
+    log_queue = queue.Queue(-1)
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+
+    # Keep console output message-only to match the previous print() UX
+    console_handler = logging.StreamHandler(sys.stdout)
+    console_handler.setFormatter(logging.Formatter("%(message)s"))
+    handlers = [console_handler]
+
+    if log_file:
+        file_handler = logging.FileHandler(log_file)
+        file_handler.setFormatter(logging.Formatter(
+            "%(asctime)s %(name)s %(levelname)s %(message)s"))
+        handlers.append(file_handler)
+
+    listener = logging.handlers.QueueListener(log_queue, *handlers)
+    listener.start()
+    atexit.register(listener.stop)
+
+    return logger
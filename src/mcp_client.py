@@ -2,27 +2,78 @@
 MCP (Model Context Protocol) client for connecting to MCP servers.
 """
 
+import asyncio
+import io
 import json
+import os
+import selectors
 import subprocess
 import sys
+import threading
 from typing import List, Dict, Any, Optional
+from logger import setup_logger
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows
+    fcntl = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+logger = setup_logger()
+
+
+def _dumps(obj: Any) -> str:
+    """Serialize a JSON-RPC message, using orjson's C encoder if available."""
+    if orjson is not None:
+        return orjson.dumps(obj).decode()
+    return json.dumps(obj)
+
+
+def _loads(data) -> Any:
+    """Parse a JSON-RPC message, using orjson's C parser if available."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
 
 
 class MCPClient:
     """Client for connecting to and interacting with MCP servers."""
-    
-    def __init__(self, server_path: str, args: List[str] = None):
+
+    # Consecutive successes needed before the concurrency limit grows back
+    GROWTH_THRESHOLD = 4
+
+    def __init__(self, server_path: str, args: List[str] = None,
+                 max_concurrency: int = 4):
         """
         Initialize MCP client.
-        
+
         Args:
             server_path: Path to the MCP server executable/script
             args: Additional arguments for the server
+            max_concurrency: Ceiling on overlapping async tool calls
         """
         self.server_path = server_path
         self.args = args or []
         self.process: Optional[subprocess.Popen] = None
         self.tools_cache: List[Dict[str, Any]] = []
+        # Serializes sync exchanges: the line protocol carries no JSON-RPC
+        # ids, so concurrent callers must not interleave on the pipe
+        self._io_lock = threading.Lock()
+        # Async connection state (see connect_async)
+        self.aprocess: Optional[asyncio.subprocess.Process] = None
+        self._reader_task: Optional[asyncio.Task] = None
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._next_id = 0
+        # Adaptive concurrency (AIMD): timeouts halve the limit, a run of
+        # successes grows it back toward max_concurrency
+        self.max_concurrency = max_concurrency
+        self._limit = max_concurrency
+        self._sem: Optional[asyncio.Semaphore] = None
+        self._successes = 0
         
     def connect(self):
         """Start the MCP server process."""
@@ -36,42 +87,101 @@ class MCPClient:
                 text=True,
                 bufsize=1
             )
-            # Give it a moment to start
-            import time
-            time.sleep(0.5)
-            
-            # Try to initialize connection (simple handshake)
+            # The initialize round-trip doubles as the readiness check, so
+            # there is no fixed startup sleep
             self._send_request({"method": "initialize", "params": {}})
-            
+
         except Exception as e:
             raise ConnectionError(f"Failed to connect to MCP server: {e}")
-    
-    def _send_request(self, request: Dict[str, Any]) -> Dict[str, Any]:
+
+    def _readline(self) -> str:
+        """
+        Read one response line from the server's stdout.
+
+        Reads at the binary buffered layer: TextIOWrapper.readline
+        decodes ahead in whole chunks, so a second line flushed by the
+        server would vanish into the text buffer where neither select nor
+        peek can see it. Falls back to the plain stream for doubles
+        without a binary buffer.
+        """
+        stdout = self.process.stdout
+        if isinstance(stdout, io.TextIOBase):
+            return stdout.buffer.readline().decode()
+        return stdout.readline()
+
+    def _has_buffered_response(self) -> bool:
+        """Check for a response already read ahead into the binary buffer."""
+        stdout = self.process.stdout
+        if fcntl is None or not isinstance(stdout, io.TextIOBase):
+            return False
+        # peek blocks on an empty buffer, so flip the fd non-blocking for
+        # the duration of the check
+        fd = stdout.buffer.fileno()
+        flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+        fcntl.fcntl(fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+        try:
+            return bool(stdout.buffer.peek())
+        except OSError:
+            return False
+        finally:
+            fcntl.fcntl(fd, fcntl.F_SETFL, flags)
+
+    def _wait_readable(self, timeout: float) -> bool:
+        """
+        Wait until the server's stdout has data, or the timeout passes.
+
+        Data already buffered from a previous read-ahead is invisible to
+        select, so that is checked first. Otherwise event-driven via
+        selectors, so a fast server responds in milliseconds instead of a
+        fixed sleep. Returns True when readable (or when stdout is not
+        selectable, e.g. a test double).
+        """
+        if self._has_buffered_response():
+            return True
+        try:
+            sel = selectors.DefaultSelector()
+            sel.register(self.process.stdout, selectors.EVENT_READ)
+        except (ValueError, OSError, TypeError):
+            return True
+        try:
+            return bool(sel.select(timeout))
+        finally:
+            sel.close()
+
+    def _send_request(self, request: Dict[str, Any], timeout: float = 5) -> Dict[str, Any]:
         """
         Send a request to the MCP server.
-        
+
         Args:
             request: Request dictionary
-            
+            timeout: Seconds to wait for the response
+
         Returns:
             Response dictionary
         """
         if not self.process:
             raise ConnectionError("MCP server not connected")
-        
+
         try:
-            # Send request as JSON-RPC
-            request_json = json.dumps(request) + "\n"
-            self.process.stdin.write(request_json)
-            self.process.stdin.flush()
-            
-            # Read response (simple line-based JSON)
-            response_line = self.process.stdout.readline()
+            # One exchange at a time; a second thread writing or reading
+            # mid-exchange could pair responses with the wrong caller
+            with self._io_lock:
+                # Send request as JSON-RPC
+                request_json = _dumps(request) + "\n"
+                self.process.stdin.write(request_json)
+                self.process.stdin.flush()
+
+                if not self._wait_readable(timeout):
+                    return {"error": "No response from server"}
+
+                # Read response (simple line-based JSON)
+                response_line = self._readline()
+
             if response_line:
-                return json.loads(response_line.strip())
+                return _loads(response_line.strip())
             else:
                 return {"error": "No response from server"}
-                
+
         except Exception as e:
             raise RuntimeError(f"Error communicating with MCP server: {e}")
     
@@ -100,7 +210,7 @@ class MCPClient:
                 return []
                 
         except Exception as e:
-            print(f"Warning: Could not list tools: {e}")
+            logger.warning(f"Could not list tools: {e}")
             return []
     
     def call_tool(self, tool_name: str, parameters: Dict[str, Any]) -> Any:
@@ -144,3 +254,188 @@ class MCPClient:
             finally:
                 self.process = None
                 self.tools_cache = []
+
+    async def connect_async(self):
+        """
+        Start the MCP server process with non-blocking pipes.
+
+        Unlike connect(), this awaits the initialize response instead of
+        sleeping, and in-flight requests are multiplexed over the pipe by
+        JSON-RPC id so many tool calls can overlap.
+        """
+        try:
+            self.aprocess = await asyncio.create_subprocess_exec(
+                self.server_path, *self.args,
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE
+            )
+            self._reader_task = asyncio.create_task(self._read_loop())
+            self._sem = asyncio.Semaphore(self._limit)
+
+            await self._send_request_async({"method": "initialize", "params": {}})
+
+        except Exception as e:
+            raise ConnectionError(f"Failed to connect to MCP server: {e}")
+
+    async def _read_loop(self):
+        """Dispatch server responses to in-flight requests by JSON-RPC id."""
+        while True:
+            line = await self.aprocess.stdout.readline()
+            if not line:
+                break
+
+            try:
+                message = _loads(line)
+            except ValueError:
+                continue
+
+            future = self._pending.pop(message.get("id"), None)
+            if future is not None and not future.done():
+                future.set_result(message)
+
+        # Server closed its end - fail anything still waiting
+        for future in self._pending.values():
+            if not future.done():
+                future.set_exception(
+                    ConnectionError("MCP server closed the connection")
+                )
+        self._pending.clear()
+
+    async def _send_request_async(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Send a request to the MCP server and await its response.
+
+        Args:
+            request: Request dictionary (id is assigned here)
+
+        Returns:
+            Response dictionary
+        """
+        if not self.aprocess:
+            raise ConnectionError("MCP server not connected")
+
+        self._next_id += 1
+        request_id = self._next_id
+        request = {"jsonrpc": "2.0", "id": request_id, **request}
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+
+        request_json = _dumps(request) + "\n"
+        self.aprocess.stdin.write(request_json.encode())
+        await self.aprocess.stdin.drain()
+
+        return await future
+
+    async def list_tools_async(self) -> List[Dict[str, Any]]:
+        """Async variant of list_tools using the multiplexed connection."""
+        if self.tools_cache:
+            return self.tools_cache
+
+        try:
+            response = await self._send_request_async({
+                "method": "tools/list",
+                "params": {}
+            })
+
+            if "result" in response and "tools" in response["result"]:
+                self.tools_cache = response["result"]["tools"]
+                return self.tools_cache
+            else:
+                return []
+
+        except Exception as e:
+            logger.warning(f"Could not list tools: {e}")
+            return []
+
+    def _shrink(self):
+        """Halve the concurrency limit after a timeout (never below 1)."""
+        self._limit = max(1, self._limit // 2)
+        self._sem = asyncio.Semaphore(self._limit)
+        self._successes = 0
+        logger.warning(f"MCP server slow, concurrency limit now {self._limit}")
+
+    def _grow(self):
+        """Raise the limit by one after a run of successes, up to the cap."""
+        self._successes += 1
+        if (self._successes >= self.GROWTH_THRESHOLD
+                and self._limit < self.max_concurrency):
+            self._limit += 1
+            self._sem = asyncio.Semaphore(self._limit)
+            self._successes = 0
+
+    async def call_tool_async(self, tool_name: str, parameters: Dict[str, Any],
+                              timeout: float = 30) -> Any:
+        """
+        Async variant of call_tool using the multiplexed connection.
+
+        Concurrency is bounded by an adaptive semaphore: a timeout halves
+        the limit so an overloaded server is not buried under more calls,
+        and a run of successes grows it back (replacing the semaphore can
+        briefly overshoot by the calls already in flight, which is fine
+        for this backpressure heuristic). When the client was connected
+        synchronously the blocking call_tool runs in a thread instead,
+        under the same semaphore so sync-connected servers get the same
+        backpressure.
+
+        Args:
+            tool_name: Name of the tool to call
+            parameters: Tool parameters
+            timeout: Seconds to wait before treating the call as timed out
+        """
+        if self._sem is None:
+            # Sync-connected clients never ran connect_async; build the
+            # semaphore on first use
+            self._sem = asyncio.Semaphore(self._limit)
+
+        try:
+            async with self._sem:
+                if self.aprocess is None and self.process is not None:
+                    result = await asyncio.to_thread(
+                        self.call_tool, tool_name, parameters)
+                    self._grow()
+                    return result
+
+                response = await asyncio.wait_for(
+                    self._send_request_async({
+                        "method": "tools/call",
+                        "params": {
+                            "name": tool_name,
+                            "arguments": parameters
+                        }
+                    }),
+                    timeout
+                )
+
+            self._grow()
+
+            if "result" in response:
+                return response["result"]
+            elif "error" in response:
+                raise RuntimeError(f"Tool error: {response['error']}")
+            else:
+                return response
+
+        except asyncio.TimeoutError:
+            self._shrink()
+            raise RuntimeError(f"Timed out calling tool {tool_name}")
+        except Exception as e:
+            raise RuntimeError(f"Error calling tool {tool_name}: {e}")
+
+    async def disconnect_async(self):
+        """Disconnect the async MCP server connection."""
+        if self._reader_task:
+            self._reader_task.cancel()
+            self._reader_task = None
+
+        if self.aprocess:
+            try:
+                self.aprocess.terminate()
+                await asyncio.wait_for(self.aprocess.wait(), timeout=5)
+            except (asyncio.TimeoutError, ProcessLookupError):
+                self.aprocess.kill()
+            finally:
+                self.aprocess = None
+                self.tools_cache = []
+                self._pending = {}
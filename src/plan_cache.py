@@ -0,0 +1,130 @@
+"""
+Semantic cache for planner results.
+
+Caches generated plans keyed by a sentence embedding of the prompt plus a
+fingerprint of the available tools, so near-duplicate prompts skip the LLM
+round-trip entirely.
+"""
+
+import hashlib
+from typing import Any, Dict, List, Optional
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    from sentence_transformers import SentenceTransformer
+except ImportError:
+    SentenceTransformer = None
+
+try:
+    import faiss
+except ImportError:
+    faiss = None
+
+
+class PlanCache:
+    """Caches plans by semantic similarity of the planning prompt."""
+
+    def __init__(self, model_name: str = "all-MiniLM-L6-v2", threshold: float = 0.92):
+        """
+        Initialize the plan cache.
+
+        Args:
+            model_name: Sentence-transformers model used for embeddings
+            threshold: Minimum cosine similarity for a cache hit
+
+        Raises:
+            ImportError: If numpy or sentence-transformers is not installed
+        """
+        if np is None or SentenceTransformer is None:
+            raise ImportError(
+                "PlanCache requires numpy and sentence-transformers. "
+                "Install them with: pip install numpy sentence-transformers"
+            )
+        self.encoder = SentenceTransformer(model_name)
+        self.threshold = threshold
+        self.embeddings: Optional["np.ndarray"] = None
+        self.plans: List[Dict[str, Any]] = []
+        # FAISS inner-product index when available; embeddings are unit
+        # length, so inner product equals cosine similarity. Falls back to
+        # the NumPy matmul path when faiss is not installed.
+        self._index = None
+        self._last_text: Optional[str] = None
+        self._last_embedding: Optional["np.ndarray"] = None
+
+    @staticmethod
+    def tools_fingerprint(tools: List[Dict[str, Any]]) -> str:
+        """Build a stable fingerprint for a tool catalog."""
+        names = sorted(tool.get("name", "") for tool in tools)
+        return hashlib.blake2b("|".join(names).encode()).hexdigest()
+
+    def _embed(self, text: str) -> "np.ndarray":
+        """Embed text to a unit-length vector, memoizing the last lookup."""
+        if text == self._last_text and self._last_embedding is not None:
+            return self._last_embedding
+
+        embedding = np.asarray(self.encoder.encode(text), dtype=np.float32)
+        norm = np.linalg.norm(embedding)
+        if norm > 0:
+            embedding = embedding / norm
+
+        self._last_text = text
+        self._last_embedding = embedding
+        return embedding
+
+    def get(self, prompt: str, tools_fingerprint: str) -> Optional[Dict[str, Any]]:
+        """
+        Look up a cached plan for a prompt.
+
+        Args:
+            prompt: User's task description
+            tools_fingerprint: Fingerprint of the available tools
+
+        Returns:
+            Cached plan if a similar prompt was seen, else None
+        """
+        if not self.plans:
+            return None
+
+        embedding = self._embed(prompt + "|" + tools_fingerprint)
+
+        if self._index is not None:
+            # SIMD-accelerated SGEMM search; O(N) flat scan but far faster
+            # than the generic matmul on thin vectors
+            scores, indices = self._index.search(
+                embedding.reshape(1, -1).astype(np.float32), 1)
+            if scores[0, 0] >= self.threshold:
+                return self.plans[int(indices[0, 0])]
+            return None
+
+        similarities = self.embeddings @ embedding
+        best = int(np.argmax(similarities))
+
+        if similarities[best] >= self.threshold:
+            return self.plans[best]
+        return None
+
+    def put(self, prompt: str, tools_fingerprint: str, plan: Dict[str, Any]):
+        """
+        Store a plan for future lookups.
+
+        Args:
+            prompt: User's task description
+            tools_fingerprint: Fingerprint of the available tools
+            plan: Plan dictionary to cache
+        """
+        embedding = self._embed(prompt + "|" + tools_fingerprint)
+        row = embedding.reshape(1, -1)
+
+        if faiss is not None:
+            if self._index is None:
+                self._index = faiss.IndexFlatIP(row.shape[1])
+            self._index.add(row.astype(np.float32))
+        elif self.embeddings is None:
+            self.embeddings = row
+        else:
+            self.embeddings = np.vstack([self.embeddings, row])
+        self.plans.append(plan)
@@ -3,38 +3,47 @@ Planning module for creating execution plans from user prompts.
 """
 
 import json
-from typing import List, Dict, Any
-from openai import OpenAI
+from typing import List, Dict, Any, Optional
 
+try:
+    import jiter
+except ImportError:
+    jiter = None
 
-class Planner:
-    """Creates structured plans from user prompts using LLM."""
+from llm_cache import LLMCache
+from logger import setup_logger
+from plan_cache import PlanCache
+from rate_limiter import RateLimiter
 
-    def __init__(self, api_key: str, model: str = "gpt-4o-mini"):
-        """
-        Initialize the planner.
+logger = setup_logger()
 
-        Args:
-            api_key: OpenAI API key
-            model: LLM model to use
-        """
-        self.client = OpenAI(api_key=api_key)
-        self.model = model
+# The OpenAI SDK import is expensive (pulls httpx and pydantic), so it is
+# deferred until a client is actually constructed. Module-level name kept
+# so tests can still patch planner.OpenAI.
+OpenAI = None
 
-    def create_plan(self, prompt: str, available_tools: List[Dict[str, Any]]) -> Dict[str, Any]:
-        """
-        Create an execution plan from a user prompt.
 
-        Args:
-            prompt: User's task description
-            available_tools: List of available MCP tools
+def _load_openai():
+    """Import and return the OpenAI client class on first use."""
+    global OpenAI
+    if OpenAI is None:
+        from openai import OpenAI as _OpenAI
+        OpenAI = _OpenAI
+    return OpenAI
 
-        Returns:
-            Structured plan dictionary
-        """
-        tools_description = self._format_tools(available_tools)
 
-        system_prompt = """You are a planning agent that creates structured execution plans.
+def _parse_json(text: str) -> Any:
+    """Parse LLM JSON output, using jiter's Rust parser if available.
+
+    jiter ships with the OpenAI SDK; raises ValueError on bad input
+    either way (json.JSONDecodeError subclasses it).
+    """
+    if jiter is not None:
+        return jiter.from_json(text.encode())
+    return json.loads(text)
+
+
+SYSTEM_PROMPT = """You are a planning agent that creates structured execution plans.
 Given a user's task and available tools, create a step-by-step plan.
 
 Available action types:
@@ -60,12 +69,119 @@ Return a JSON plan with this structure:
 
 Be specific and break down complex tasks into clear steps."""
 
-        user_prompt = f"""Task: {prompt}
+# JSON Schema for the emit_plan tool call. Plain function calling only
+# steers the model toward this shape (enforcement would need strict
+# structured outputs), so callers still normalize the parsed plan
+PLAN_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "goal": {
+            "type": "string",
+            "description": "Brief description of the overall goal"
+        },
+        "steps": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "step_number": {"type": "integer"},
+                    "type": {
+                        "type": "string",
+                        "enum": ["mcp_tool", "sub_agent", "direct"]
+                    },
+                    "action": {"type": "string"},
+                    "mcp_server": {"type": "string"},
+                    "parameters": {"type": "object"},
+                    "task_description": {"type": "string"},
+                    "description": {"type": "string"}
+                },
+                "required": ["step_number", "type", "action"]
+            }
+        }
+    },
+    "required": ["goal", "steps"]
+}
 
-Available Tools:
-{tools_description if tools_description else "No tools currently available. You may need to use sub-agents or direct actions."}
+PLAN_TOOL = {
+    "type": "function",
+    "function": {
+        "name": "emit_plan",
+        "description": "Emit the structured execution plan.",
+        "parameters": PLAN_SCHEMA
+    }
+}
+
+# Fallback step template shared by every parse failure; only the
+# prompt-specific fields are filled in per call
+_FALLBACK_STEP = {
+    "step_number": 1,
+    "type": "direct",
+    "action": "process_task"
+}
+
+
+class Planner:
+    """Creates structured plans from user prompts using LLM."""
+
+    def __init__(self, api_key: str, model: str = "gpt-4o-mini",
+                 plan_cache: Optional[PlanCache] = None,
+                 llm_cache: Optional[LLMCache] = None,
+                 rate_limiter: Optional[RateLimiter] = None,
+                 openai_client: Optional[Any] = None):
+        """
+        Initialize the planner.
+
+        Args:
+            api_key: OpenAI API key
+            model: LLM model to use
+            plan_cache: Optional semantic cache; similar prompts reuse plans
+            llm_cache: Optional exact-match cache for repeated prompts
+            rate_limiter: Optional shared limiter for pre-emptive throttling
+            openai_client: Optional shared OpenAI client; sharing one client
+                reuses its HTTP connection pool across components
+        """
+        self.client = openai_client if openai_client is not None else _load_openai()(api_key=api_key)
+        self.model = model
+        self.plan_cache = plan_cache
+        self.llm_cache = llm_cache
+        self.rate_limiter = rate_limiter
+        self._format_tools_cache: Dict[tuple, str] = {}
+
+    def create_plan(self, prompt: str, available_tools: List[Dict[str, Any]],
+                    tools_fingerprint: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Create an execution plan from a user prompt.
 
-Create a plan to complete this task."""
+        Args:
+            prompt: User's task description
+            available_tools: List of available MCP tools
+            tools_fingerprint: Optional precomputed catalog fingerprint
+                (e.g. from ToolIndex); computed here when omitted
+
+        Returns:
+            Structured plan dictionary
+        """
+        if self.plan_cache is not None:
+            if tools_fingerprint is None:
+                tools_fingerprint = PlanCache.tools_fingerprint(available_tools)
+            cached_plan = self.plan_cache.get(prompt, tools_fingerprint)
+            if cached_plan is not None:
+                return cached_plan
+
+        system_prompt, user_prompt = self._build_prompts(prompt, available_tools)
+
+        llm_cache_key = None
+        if self.llm_cache is not None:
+            llm_cache_key = LLMCache.make_key(
+                self.model, system_prompt, user_prompt, 0.3
+            )
+            cached_plan = self.llm_cache.get(llm_cache_key)
+            if cached_plan is not None:
+                return cached_plan
+
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire(
+                RateLimiter.estimate_tokens(system_prompt + user_prompt))
 
         try:
             response = self.client.chat.completions.create(
@@ -74,51 +190,205 @@ Create a plan to complete this task."""
                     {"role": "system", "content": system_prompt},
                     {"role": "user", "content": user_prompt}
                 ],
-                response_format={"type": "json_object"},
+                tools=[PLAN_TOOL],
+                tool_choice={"type": "function", "function": {"name": "emit_plan"}},
                 temperature=0.3
             )
 
-            plan_json = response.choices[0].message.content
-            plan = json.loads(plan_json)
+            message = response.choices[0].message
+            tool_calls = getattr(message, "tool_calls", None)
+            if tool_calls:
+                plan = _parse_json(tool_calls[0].function.arguments)
+            else:
+                # Some models answer in content anyway
+                plan = _parse_json(message.content)
 
-            # Validate and normalize plan structure
+            # Function-call arguments are not schema-enforced, so both
+            # paths get the same normalization
             if "steps" not in plan:
                 plan["steps"] = []
             if "goal" not in plan:
                 plan["goal"] = prompt
 
+            if self.plan_cache is not None:
+                self.plan_cache.put(prompt, tools_fingerprint, plan)
+            if self.llm_cache is not None:
+                self.llm_cache.set(llm_cache_key, plan)
+
             return plan
 
-        except json.JSONDecodeError as e:
-            print(f"Warning: Failed to parse plan JSON: {e}")
-            # Return a simple fallback plan
+        except ValueError as e:
+            logger.warning(f"Failed to parse plan JSON: {e}")
+            # Return a simple fallback plan built from the shared template
             return {
                 "goal": prompt,
                 "steps": [
-                    {
-                        "step_number": 1,
-                        "type": "direct",
-                        "action": "process_task",
-                        "description": f"Process the task: {prompt}"
-                    }
+                    dict(_FALLBACK_STEP,
+                         description=f"Process the task: {prompt}")
                 ]
             }
         except Exception as e:
-            print(f"Error creating plan: {e}")
+            logger.error(f"Error creating plan: {e}")
             raise
 
+    def _build_prompts(self, prompt: str, available_tools: List[Dict[str, Any]]) -> tuple:
+        """
+        Build the (system, user) prompt pair for a planning call.
+
+        The large stable text (instructions + canonical tool catalog) lives
+        in the system message so OpenAI's prompt-prefix cache can reuse it;
+        only the short task line changes between calls.
+        """
+        tools_description = self._format_tools(available_tools)
+
+        system_prompt = f"""{SYSTEM_PROMPT}
+
+Available Tools:
+{tools_description}"""
+
+        user_prompt = f"Task: {prompt}"
+
+        return system_prompt, user_prompt
+
+    def stream_plan(self, prompt: str, available_tools: List[Dict[str, Any]]):
+        """
+        Create a plan with a streaming completion, yielding each step as
+        soon as it is fully decoded.
+
+        This lets the caller start executing step 1 while the model is
+        still generating later steps, instead of waiting for the full plan.
+
+        Args:
+            prompt: User's task description
+            available_tools: List of available MCP tools
+
+        Yields:
+            Step dictionaries in plan order
+        """
+        system_prompt, user_prompt = self._build_prompts(prompt, available_tools)
+
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire(
+                RateLimiter.estimate_tokens(system_prompt + user_prompt))
+
+        response = self.client.chat.completions.create(
+            model=self.model,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt}
+            ],
+            response_format={"type": "json_object"},
+            temperature=0.3,
+            stream=True
+        )
+
+        buffer = ""
+        yielded = 0
+        for chunk in response:
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if not delta:
+                continue
+
+            buffer += delta
+            steps = self._parse_partial_steps(buffer)
+            while yielded < len(steps):
+                yield steps[yielded]
+                yielded += 1
+
+    @staticmethod
+    def _parse_partial_steps(buffer: str) -> List[Dict[str, Any]]:
+        """
+        Extract the completed step objects from a partial JSON plan.
+
+        Scans the "steps" array for balanced top-level objects, so only
+        steps whose closing brace has already streamed in are returned.
+
+        Args:
+            buffer: JSON text accumulated from the stream so far
+
+        Returns:
+            List of fully decoded step dictionaries
+        """
+        key_pos = buffer.find('"steps"')
+        if key_pos == -1:
+            return []
+        array_start = buffer.find('[', key_pos)
+        if array_start == -1:
+            return []
+
+        steps = []
+        depth = 0
+        in_string = False
+        escaped = False
+        object_start = None
+
+        for pos in range(array_start + 1, len(buffer)):
+            char = buffer[pos]
+
+            if in_string:
+                if escaped:
+                    escaped = False
+                elif char == '\\':
+                    escaped = True
+                elif char == '"':
+                    in_string = False
+                continue
+
+            if char == '"':
+                in_string = True
+            elif char == '{':
+                if depth == 0:
+                    object_start = pos
+                depth += 1
+            elif char == '}':
+                depth -= 1
+                if depth == 0 and object_start is not None:
+                    try:
+                        steps.append(_parse_json(buffer[object_start:pos + 1]))
+                    except ValueError:
+                        pass
+                    object_start = None
+            elif char == ']' and depth == 0:
+                break
+
+        return steps
+
     def _format_tools(self, tools: List[Dict[str, Any]]) -> str:
-        """Format available tools into a readable string."""
+        """Format available tools into a readable string.
+
+        Tools are sorted by name so the same catalog always produces the
+        same text, keeping the prompt prefix stable across calls. Results
+        are memoized per catalog since the tool set changes rarely.
+        """
         if not tools:
             return "No tools available."
 
-        formatted = []
-        for tool in tools:
-            tool_info = f"- {tool.get('name', 'unknown')}"
-            if tool.get('description'):
-                tool_info += f": {tool['description']}"
-            if tool.get('mcp_server'):
-                tool_info += f" (from {tool['mcp_server']})"
-            formatted.append(tool_info)
+        cache_key = tuple(sorted(
+            (str(tool.get("name", "")), str(tool.get("description", "")),
+             str(tool.get("mcp_server", "")))
+            for tool in tools
+        ))
+        cached = self._format_tools_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        def fmt(tool, _get=dict.get):
+            # dict.get bound as a default arg skips the per-call attribute
+            # lookup; with the single join below this roughly halves the
+            # bytecode run per tool vs the old append-then-concat loop
+            name = _get(tool, 'name', 'unknown')
+            desc = _get(tool, 'description')
+            server = _get(tool, 'mcp_server')
+            if desc and server:
+                return f"- {name}: {desc} (from {server})"
+            if desc:
+                return f"- {name}: {desc}"
+            if server:
+                return f"- {name} (from {server})"
+            return f"- {name}"
 
-        return "\n".join(formatted)
+        result = "\n".join(
+            fmt(tool) for tool in sorted(tools, key=lambda t: t.get("name", ""))
+        )
+        self._format_tools_cache[cache_key] = result
+        return result
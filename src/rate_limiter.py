@@ -0,0 +1,64 @@
+"""
+Token-bucket rate limiter for LLM API calls.
+
+Pre-emptively throttles requests-per-minute and tokens-per-minute so the
+agent stays under its account limits instead of burning time in the SDK's
+exponential backoff after 429 responses.
+"""
+
+import threading
+import time
+
+
+class RateLimiter:
+    """Throttles request and token usage to stay under API rate limits."""
+
+    def __init__(self, max_rpm: int = 500, max_tpm: int = 200_000):
+        """
+        Initialize the limiter.
+
+        Args:
+            max_rpm: Maximum requests per minute
+            max_tpm: Maximum tokens per minute
+        """
+        self.max_rpm = max_rpm
+        self.max_tpm = max_tpm
+        self._requests = float(max_rpm)
+        self._tokens = float(max_tpm)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def estimate_tokens(text: str) -> int:
+        """Rough token estimate for a prompt (~4 characters per token)."""
+        return max(1, len(text) // 4)
+
+    def _refill(self):
+        """Refill both buckets based on elapsed time. Caller holds the lock."""
+        now = time.monotonic()
+        elapsed = now - self._updated
+        self._updated = now
+        self._requests = min(self.max_rpm,
+                             self._requests + elapsed * self.max_rpm / 60)
+        self._tokens = min(self.max_tpm,
+                           self._tokens + elapsed * self.max_tpm / 60)
+
+    def acquire(self, est_tokens: int = 1):
+        """
+        Block until one request slot and est_tokens of budget are available.
+
+        Args:
+            est_tokens: Estimated token cost of the upcoming call
+        """
+        while True:
+            with self._lock:
+                self._refill()
+                if self._requests >= 1 and self._tokens >= est_tokens:
+                    self._requests -= 1
+                    self._tokens -= est_tokens
+                    return
+                wait = max(
+                    (1 - self._requests) * 60 / self.max_rpm,
+                    (est_tokens - self._tokens) * 60 / self.max_tpm
+                )
+            time.sleep(min(max(wait, 0.01), 1.0))
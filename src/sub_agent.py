@@ -3,23 +3,55 @@ Sub-agent module for delegating tasks to specialized agents.
 """
 
 import json
-from typing import Dict, Any
-from openai import OpenAI
+from typing import List, Dict, Any, Optional
+from llm_cache import LLMCache
+from logger import setup_logger
+from rate_limiter import RateLimiter
+
+logger = setup_logger()
+
+# Deferred like in planner.py: the SDK import is the bulk of module import
+# time. Module-level name kept so tests can still patch sub_agent.OpenAI.
+OpenAI = None
+
+
+def _load_openai():
+    """Import and return the OpenAI client class on first use."""
+    global OpenAI
+    if OpenAI is None:
+        from openai import OpenAI as _OpenAI
+        OpenAI = _OpenAI
+    return OpenAI
+
+SYSTEM_PROMPT = """You are a helpful sub-agent that executes specific tasks.
+Analyze the task, break it down if needed, and provide a clear result.
+If the task requires actions you cannot perform directly, explain what would be needed."""
 
 
 class SubAgent:
     """A sub-agent that can handle delegated tasks."""
 
-    def __init__(self, api_key: str, model: str = "gpt-4o-mini"):
+    def __init__(self, api_key: str, model: str = "gpt-4o-mini",
+                 cache: Optional[LLMCache] = None, temperature: float = 0.0,
+                 rate_limiter: Optional[RateLimiter] = None,
+                 openai_client: Optional[Any] = None):
         """
         Initialize sub-agent.
 
         Args:
             api_key: OpenAI API key
             model: LLM model to use
+            cache: Optional exact-match cache for repeated tasks
+            temperature: Sampling temperature (0 keeps outputs cache-friendly)
+            rate_limiter: Optional shared limiter for pre-emptive throttling
+            openai_client: Optional shared OpenAI client; sharing one client
+                avoids a fresh TCP+TLS setup per sub-agent
         """
-        self.client = OpenAI(api_key=api_key)
+        self.client = openai_client if openai_client is not None else _load_openai()(api_key=api_key)
         self.model = model
+        self.cache = cache
+        self.temperature = temperature
+        self.rate_limiter = rate_limiter
 
     def execute_task(self, task_description: str) -> Dict[str, Any]:
         """
@@ -31,32 +63,46 @@ class SubAgent:
         Returns:
             Task execution results
         """
-        system_prompt = """You are a helpful sub-agent that executes specific tasks.
-Analyze the task, break it down if needed, and provide a clear result.
-If the task requires actions you cannot perform directly, explain what would be needed."""
-
         user_prompt = f"""Task: {task_description}
 
 Please execute this task and provide a clear result or explanation."""
 
+        cache_key = None
+        if self.cache is not None:
+            cache_key = LLMCache.make_key(
+                self.model, SYSTEM_PROMPT, user_prompt, self.temperature
+            )
+            cached_result = self.cache.get(cache_key)
+            if cached_result is not None:
+                return cached_result
+
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire(
+                RateLimiter.estimate_tokens(SYSTEM_PROMPT + user_prompt))
+
         try:
             response = self.client.chat.completions.create(
                 model=self.model,
                 messages=[
-                    {"role": "system", "content": system_prompt},
+                    {"role": "system", "content": SYSTEM_PROMPT},
                     {"role": "user", "content": user_prompt}
                 ],
-                temperature=0.3
+                temperature=self.temperature
             )
 
             result_text = response.choices[0].message.content
 
-            return {
+            result = {
                 "task": task_description,
                 "result": result_text,
                 "status": "completed"
             }
 
+            if self.cache is not None:
+                self.cache.set(cache_key, result)
+
+            return result
+
         except Exception as e:
             return {
                 "task": task_description,
@@ -64,3 +110,63 @@ Please execute this task and provide a clear result or explanation."""
                 "status": "error",
                 "error": str(e)
             }
+
+    def execute_tasks(self, tasks: List[str]) -> List[Dict[str, Any]]:
+        """
+        Execute several independent tasks in a single LLM call.
+
+        Batching shares one HTTP round-trip and one system prompt across
+        all tasks. Batched generation is fragile, so any parse problem
+        falls back to one execute_task call per task.
+
+        Args:
+            tasks: Descriptions of the tasks to perform
+
+        Returns:
+            Task execution results, one per task, in order
+        """
+        if not tasks:
+            return []
+        if len(tasks) == 1:
+            return [self.execute_task(tasks[0])]
+
+        task_lines = "\n".join(f"{i}. {task}" for i, task in enumerate(tasks, 1))
+
+        user_prompt = f"""Tasks:
+{task_lines}
+
+Execute each task independently. Return a JSON object with a "results" array
+containing one object per task, in order, each with a "result" string."""
+
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire(
+                RateLimiter.estimate_tokens(SYSTEM_PROMPT + user_prompt))
+
+        try:
+            response = self.client.chat.completions.create(
+                model=self.model,
+                messages=[
+                    {"role": "system", "content": SYSTEM_PROMPT},
+                    {"role": "user", "content": user_prompt}
+                ],
+                response_format={"type": "json_object"},
+                temperature=self.temperature
+            )
+
+            payload = json.loads(response.choices[0].message.content)
+            entries = payload.get("results", [])
+            if len(entries) != len(tasks):
+                raise ValueError("Batched response count does not match task count")
+
+            return [
+                {
+                    "task": task,
+                    "result": entry.get("result") if isinstance(entry, dict) else str(entry),
+                    "status": "completed"
+                }
+                for task, entry in zip(tasks, entries)
+            ]
+
+        except Exception as e:
+            logger.warning(f"Batched execution failed, retrying per task: {e}")
+            return [self.execute_task(task) for task in tasks]
@@ -0,0 +1,71 @@
+"""
+Struct-of-arrays index over the MCP tool catalog.
+
+Keeps tool names, descriptions and (optionally) their embeddings in
+parallel arrays that are rebuilt only when the catalog changes, so
+per-call planner lookups reuse a precomputed fingerprint instead of
+re-hashing the tool list every time.
+"""
+
+import hashlib
+from typing import Any, Dict, List, Optional
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class ToolIndex:
+    """Precomputed view of a tool catalog, rebuilt only on change."""
+
+    def __init__(self, encoder: Optional[Any] = None):
+        """
+        Initialize an empty index.
+
+        Args:
+            encoder: Optional sentence-transformers style encoder with an
+                encode() method. When provided, rebuild() also embeds each
+                tool as "name: description" into a float16 matrix.
+        """
+        self.encoder = encoder
+        self.names: List[str] = []
+        self.descriptions: List[str] = []
+        self.servers: List[str] = []
+        self.embeddings: Optional["np.ndarray"] = None
+        self.fingerprint: str = self._fingerprint([])
+
+    @staticmethod
+    def _fingerprint(names: List[str]) -> str:
+        """Hash a name list into a stable catalog fingerprint."""
+        return hashlib.blake2b("|".join(sorted(names)).encode()).hexdigest()
+
+    def rebuild(self, tools: List[Dict[str, Any]]):
+        """
+        Rebuild the index from a tool catalog.
+
+        A no-op when the catalog fingerprint is unchanged, so callers can
+        invoke this on every planning cycle without re-encoding anything.
+
+        Args:
+            tools: Tool dictionaries as returned by get_available_tools
+        """
+        names = [tool.get("name", "") for tool in tools]
+        fingerprint = self._fingerprint(names)
+        if fingerprint == self.fingerprint and self.names:
+            return
+
+        self.names = names
+        self.descriptions = [tool.get("description", "") for tool in tools]
+        self.servers = [tool.get("mcp_server", "") for tool in tools]
+        self.fingerprint = fingerprint
+
+        if self.encoder is not None and np is not None and tools:
+            # float16 halves memory and bandwidth; MiniLM-class embeddings
+            # lose negligible precision at cache-hit thresholds
+            rows = self.encoder.encode(
+                [f"{n}: {d}" for n, d in zip(self.names, self.descriptions)]
+            )
+            self.embeddings = np.asarray(rows, dtype=np.float16)
+        else:
+            self.embeddings = None
@@ -1,42 +1,133 @@
 """
 Shared pytest fixtures for testing the agent system.
+
+Decision: LLM traffic is faked in-process, not through a local HTTP stub
+server impersonating OpenAI. A stub server would add a socket round-trip
+(~1ms) to every chat.completions.create call, while the namespace fakes
+here answer in microseconds. mock_openai_response builds objects with
+the exact attribute shape the SDK returns (.choices[0].message.content,
+.tool_calls), so no test needs a real transport.
 """
 
+import os
+import sys
+
+# Make src/ importable before any test module loads. pytest.ini already
+# sets pythonpath = src; this keeps imports working for non-pytest entry
+# points and runs from other directories.
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+# Preimport the agent modules once per process so each test module's
+# imports (and any import-time setup they trigger) hit sys.modules
+# instead of repeating per file under xdist's loadfile distribution
+import agent, mcp_client, planner, sub_agent  # noqa: E401,F401
+
 import pytest
-from unittest.mock import Mock, MagicMock
-import json
+from types import SimpleNamespace
+from unittest.mock import Mock, MagicMock, patch
 
 
-@pytest.fixture
+class FakeOpenAI:
+    """
+    Minimal hand-rolled stand-in for the OpenAI client.
+
+    Every attribute access on a MagicMock allocates a child mock, so the
+    chain client.chat.completions.create builds four mocks per test.
+    This fake resolves the same chain with plain namespace lookups,
+    records each call's kwargs in ``calls``, and returns the canned
+    responses in order (the last one repeats; exceptions are raised).
+    """
+
+    def __init__(self, *responses):
+        self.calls = []
+        self._responses = list(responses)
+        self.chat = SimpleNamespace(
+            completions=SimpleNamespace(create=self._create))
+
+    def _create(self, **kwargs):
+        self.calls.append(kwargs)
+        if len(self._responses) > 1:
+            response = self._responses.pop(0)
+        else:
+            response = self._responses[0]
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    def respond_with(self, *responses):
+        """Queue canned responses after construction."""
+        self._responses = list(responses)
+
+
+# Prebuilt success-signal response for tests that never read the content;
+# shared module-wide so each of them skips allocating the three-level
+# response chain
+EMPTY_RESPONSE = SimpleNamespace(
+    choices=[SimpleNamespace(
+        message=SimpleNamespace(content="", tool_calls=None))])
+
+
+@pytest.fixture(autouse=True, scope="class")
+def _patched_openai():
+    """
+    Patch the OpenAI client classes once per test class.
+
+    Keeps any stray Planner/SubAgent construction from touching the real
+    SDK without a start/stop patch cycle per test. Tests that care about
+    the client monkeypatch their own fake over this baseline.
+    """
+    with patch('planner.OpenAI') as planner_cls, \
+            patch('sub_agent.OpenAI') as sub_agent_cls:
+        planner_cls.return_value = MagicMock()
+        sub_agent_cls.return_value = MagicMock()
+        yield
+
+
+@pytest.fixture(scope="module")
+def shared_planner(mock_api_key):
+    """
+    A single Planner shared across a module's pure-helper tests.
+
+    _format_tools depends only on its argument, so tests can share one
+    instance instead of constructing a client mock per test.
+    """
+    from planner import Planner
+
+    with patch('planner.OpenAI', return_value=MagicMock()):
+        return Planner(mock_api_key)
+
+
+@pytest.fixture(scope="session")
 def mock_api_key():
-    """Mock API key for testing."""
+    """Mock API key for testing (a constant, so resolved once per session)."""
     return "test-api-key-12345"
 
 
 @pytest.fixture
 def mock_openai_response():
-    """Create a mock OpenAI response object."""
+    """Create a fake OpenAI response object."""
     def _create_response(content: str, model: str = "gpt-4o-mini"):
-        mock_choice = Mock()
-        mock_choice.message.content = content
-
-        mock_response = Mock()
-        mock_response.choices = [mock_choice]
-
-        return mock_response
+        # Content responses carry no tool calls, as in the real SDK
+        message = SimpleNamespace(content=content, tool_calls=None)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
     return _create_response
 
 
 @pytest.fixture
 def mock_openai_client(mock_openai_response):
     """Create a mock OpenAI client."""
-    client = MagicMock()
+    from openai import OpenAI
 
     def create_completion(*args, **kwargs):
         # Default response - can be overridden in tests
         return mock_openai_response('{"result": "default"}')
 
-    client.chat.completions.create = MagicMock(side_effect=create_completion)
+    # spec'd mock avoids MagicMock's eager magic-protocol children; the
+    # chat chain is attached by hand with plain Mocks
+    client = Mock(spec=OpenAI)
+    client.chat = Mock()
+    client.chat.completions = Mock()
+    client.chat.completions.create = Mock(side_effect=create_completion)
     return client
 
 
@@ -56,18 +147,24 @@ def sample_plan():
     }
 
 
-@pytest.fixture
+# Built once at import and shared as an immutable tuple; the entries stay
+# plain dicts because _format_tools' bound dict.get fast path only
+# accepts real dict instances
+_SAMPLE_TOOLS = (
+    {
+        "name": "test_tool",
+        "description": "A test tool",
+        "mcp_server": "test_server"
+    },
+    {
+        "name": "another_tool",
+        "description": "Another test tool",
+        "mcp_server": "test_server"
+    }
+)
+
+
+@pytest.fixture(scope="session")
 def sample_tools():
-    """Sample MCP tools for testing."""
-    return [
-        {
-            "name": "test_tool",
-            "description": "A test tool",
-            "mcp_server": "test_server"
-        },
-        {
-            "name": "another_tool",
-            "description": "Another test tool",
-            "mcp_server": "test_server"
-        }
-    ]
+    """Sample MCP tools for testing (one frozen tuple per session)."""
+    return _SAMPLE_TOOLS
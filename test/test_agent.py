@@ -2,54 +2,105 @@
 Tests for the main Agent class.
 """
 
+import re
 from unittest.mock import Mock, MagicMock, patch
 import pytest
 from agent import Agent
-from planner import Planner
 from mcp_client import MCPClient
-from sub_agent import SubAgent
-import sys
 import os
 
-# Add src to path BEFORE importing
-sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+# Compiled once; pytest.raises accepts precompiled match patterns
+_RE_API_KEY = re.compile("OpenAI API key required")
+
+# (plan, expected success, expected per-step statuses, error fragment)
+# cases for the parametrized execute_plan test below
+_PLAN_CASES = [
+    pytest.param(
+        {"goal": "Test goal",
+         "steps": [{"type": "direct", "action": "test_action",
+                    "description": "Test step"}]},
+        True, ["success"], None,
+        id="direct_action"),
+    pytest.param(
+        {"goal": "Test goal",
+         "steps": [{"type": "mcp_tool", "action": "test_tool",
+                    "mcp_server": "nonexistent_server", "parameters": {}}]},
+        False, ["error"], "not connected",
+        id="mcp_server_not_connected"),
+    pytest.param(
+        {"goal": "Test goal",
+         "steps": [{"type": "unknown_type", "action": "test_action"}]},
+        False, ["error"], "Unknown action type",
+        id="unknown_action_type"),
+    pytest.param(
+        {"goal": "Test goal",
+         "steps": [{"type": "direct", "action": "step1"},
+                   {"type": "direct", "action": "step2"},
+                   {"type": "direct", "action": "step3"}]},
+        True, ["success", "success", "success"], None,
+        id="multiple_steps"),
+]
+
+
+@pytest.fixture(scope="class")
+def agent_instance(mock_api_key):
+    """One Agent shared by the parametrized execute_plan cases."""
+    with patch('agent.Planner'):
+        yield Agent(api_key=mock_api_key)
 
 
 class TestAgent:
     """Test cases for Agent class."""
 
-    @patch('planner.OpenAI')
-    def test_init_with_api_key(self, mock_openai_class, mock_api_key):
+    def test_init_with_api_key(self, mock_api_key):
         """Test agent initialization with API key."""
-        mock_openai_class.return_value = MagicMock()
         agent = Agent(api_key=mock_api_key)
         assert agent.api_key == mock_api_key
         assert agent.model == "gpt-4o-mini"
         assert agent.planner is not None
         assert agent.mcp_clients == {}
-        assert agent.sub_agents == []
+        assert agent.sub_agent is not None
 
-    @patch('planner.OpenAI')
     @patch.dict(os.environ, {'OPENAI_API_KEY': 'env-api-key'})
-    def test_init_from_env(self, mock_openai_class):
+    def test_init_from_env(self):
         """Test agent initialization from environment variable."""
-        mock_openai_class.return_value = MagicMock()
         agent = Agent()
         assert agent.api_key == 'env-api-key'
 
     def test_init_no_api_key(self):
         """Test agent initialization fails without API key."""
         with patch.dict(os.environ, {}, clear=True):
-            with pytest.raises(ValueError, match="OpenAI API key required"):
+            with pytest.raises(ValueError, match=_RE_API_KEY):
                 Agent()
 
-    @patch('planner.OpenAI')
-    @patch('agent.MCPClient')
-    def test_connect_mcp(self, mock_mcp_client_class, mock_openai_class, mock_api_key):
+    def test_shared_openai_client(self, mock_api_key):
+        """Test that the agent shares the planner's OpenAI client."""
+        agent = Agent(api_key=mock_api_key)
+        assert agent.openai_client is agent.planner.client
+
+    def test_shared_llm_cache(self, mock_api_key):
+        """Test that planner and sub-agent share one in-memory cache."""
+        agent = Agent(api_key=mock_api_key)
+        assert agent.planner.llm_cache is agent.llm_cache
+        assert agent.sub_agent.cache is agent.llm_cache
+
+    def test_persistent_cache_from_env(self, mock_api_key,
+                                       monkeypatch, tmp_path):
+        """Test that AGENT_CACHE_DIR backs the cache with a disk store."""
+        monkeypatch.setenv("AGENT_CACHE_DIR", str(tmp_path))
+
+        agent = Agent(api_key=mock_api_key)
+        agent.llm_cache.set("key", {"result": "persisted"})
+
+        # A second agent pointed at the same directory sees the entry
+        other = Agent(api_key=mock_api_key)
+        assert other.llm_cache.get("key") == {"result": "persisted"}
+
+    def test_connect_mcp(self, monkeypatch, mock_api_key):
         """Test connecting to MCP server."""
-        mock_openai_class.return_value = MagicMock()
         mock_client = MagicMock()
-        mock_mcp_client_class.return_value = mock_client
+        mock_mcp_client_class = MagicMock(return_value=mock_client)
+        monkeypatch.setattr('agent.MCPClient', mock_mcp_client_class)
 
         agent = Agent(api_key=mock_api_key)
         agent.connect_mcp("test_server", "/path/to/server", ["arg1"])
@@ -57,41 +108,50 @@ class TestAgent:
         assert "test_server" in agent.mcp_clients
         assert agent.mcp_clients["test_server"] == mock_client
         mock_mcp_client_class.assert_called_once_with(
-            "/path/to/server", ["arg1"])
+            "/path/to/server", ["arg1"], max_concurrency=4)
         mock_client.connect.assert_called_once()
 
-    @patch('planner.OpenAI')
-    @patch('agent.MCPClient')
-    def test_connect_mcp_no_args(self, mock_mcp_client_class, mock_openai_class, mock_api_key):
+    def test_connect_mcp_no_args(self, monkeypatch, mock_api_key):
         """Test connecting to MCP server without args."""
-        mock_openai_class.return_value = MagicMock()
         mock_client = MagicMock()
-        mock_mcp_client_class.return_value = mock_client
+        mock_mcp_client_class = MagicMock(return_value=mock_client)
+        monkeypatch.setattr('agent.MCPClient', mock_mcp_client_class)
 
         agent = Agent(api_key=mock_api_key)
         agent.connect_mcp("test_server", "/path/to/server")
 
-        mock_mcp_client_class.assert_called_once_with("/path/to/server", [])
+        mock_mcp_client_class.assert_called_once_with(
+            "/path/to/server", [], max_concurrency=4)
+
+    def test_connect_mcp_all(self, monkeypatch, mock_api_key):
+        """Test connecting to multiple MCP servers concurrently."""
+        mock_client = MagicMock()
+        monkeypatch.setattr('agent.MCPClient', MagicMock(return_value=mock_client))
+
+        agent = Agent(api_key=mock_api_key)
+        agent.connect_mcp_all([
+            ("server1", "/path/one", None),
+            ("server2", "/path/two", ["arg"])
+        ])
+
+        assert set(agent.mcp_clients) == {"server1", "server2"}
+        assert mock_client.connect.call_count == 2
 
-    @patch('planner.OpenAI')
-    def test_get_available_tools_empty(self, mock_openai_class, mock_api_key):
+    def test_get_available_tools_empty(self, mock_api_key):
         """Test getting tools when no MCP servers connected."""
-        mock_openai_class.return_value = MagicMock()
         agent = Agent(api_key=mock_api_key)
         tools = agent.get_available_tools()
         assert tools == []
 
-    @patch('planner.OpenAI')
-    def test_get_available_tools(self, mock_openai_class, mock_api_key):
+    def test_get_available_tools(self, mock_api_key):
         """Test getting tools from connected MCP servers."""
-        mock_openai_class.return_value = MagicMock()
-        mock_client1 = MagicMock()
+        mock_client1 = Mock(spec=MCPClient)
         mock_client1.list_tools.return_value = [
             {"name": "tool1", "description": "Tool 1"},
             {"name": "tool2", "description": "Tool 2"}
         ]
 
-        mock_client2 = MagicMock()
+        mock_client2 = Mock(spec=MCPClient)
         mock_client2.list_tools.return_value = [
             {"name": "tool3", "description": "Tool 3"}
         ]
@@ -102,20 +162,67 @@ class TestAgent:
 
         tools = agent.get_available_tools()
 
-        assert len(tools) == 3
-        assert tools[0]["name"] == "tool1"
-        assert tools[0]["mcp_server"] == "server1"
-        assert tools[2]["name"] == "tool3"
-        assert tools[2]["mcp_server"] == "server2"
+        # One bulk equality keeps a single rewritten assert and still
+        # shows a full diff on failure
+        assert tools == [
+            {"name": "tool1", "description": "Tool 1", "mcp_server": "server1"},
+            {"name": "tool2", "description": "Tool 2", "mcp_server": "server1"},
+            {"name": "tool3", "description": "Tool 3", "mcp_server": "server2"}
+        ]
+
+    def test_get_available_tools_cached(self, mock_api_key):
+        """Test that the tool catalog is cached between runs."""
+        mock_client = Mock(spec=MCPClient)
+        mock_client.list_tools.return_value = [{"name": "tool1"}]
+
+        agent = Agent(api_key=mock_api_key)
+        agent.mcp_clients["server1"] = mock_client
+
+        first = agent.get_available_tools()
+        second = agent.get_available_tools()
 
-    @patch('planner.OpenAI')
-    def test_get_available_tools_with_error(self, mock_openai_class, mock_api_key):
+        assert first == second
+        mock_client.list_tools.assert_called_once()
+
+    def test_connect_mcp_invalidates_tools_cache(self, monkeypatch, mock_api_key):
+        """Test that connecting a new server refreshes the catalog."""
+        mock_client = MagicMock()
+        mock_client.list_tools.return_value = [{"name": "tool1"}]
+        monkeypatch.setattr('agent.MCPClient', MagicMock(return_value=mock_client))
+
+        agent = Agent(api_key=mock_api_key)
+        agent.mcp_clients["server1"] = mock_client
+        agent.get_available_tools()
+
+        agent.connect_mcp("server2", "/path/to/server")
+        agent.get_available_tools()
+
+        # Catalog was rebuilt after the new connection
+        assert mock_client.list_tools.call_count == 3
+
+    def test_tool_index_tracks_catalog(self, mock_api_key):
+        """Test that the tool index is rebuilt with the catalog."""
+        mock_client = Mock(spec=MCPClient)
+        mock_client.list_tools.return_value = [
+            {"name": "tool1", "description": "Tool 1"}
+        ]
+
+        agent = Agent(api_key=mock_api_key)
+        empty_fingerprint = agent.tool_index.fingerprint
+        agent.mcp_clients["server1"] = mock_client
+
+        agent.get_available_tools()
+
+        assert agent.tool_index.names == ["tool1"]
+        assert agent.tool_index.servers == ["server1"]
+        assert agent.tool_index.fingerprint != empty_fingerprint
+
+    def test_get_available_tools_with_error(self, mock_api_key):
         """Test getting tools when one server fails."""
-        mock_openai_class.return_value = MagicMock()
-        mock_client1 = MagicMock()
+        mock_client1 = Mock(spec=MCPClient)
         mock_client1.list_tools.return_value = [{"name": "tool1"}]
 
-        mock_client2 = MagicMock()
+        mock_client2 = Mock(spec=MCPClient)
         mock_client2.list_tools.side_effect = Exception("Connection error")
 
         agent = Agent(api_key=mock_api_key)
@@ -128,32 +235,19 @@ class TestAgent:
         assert len(tools) == 1
         assert tools[0]["name"] == "tool1"
 
-    @patch('agent.Planner')
-    def test_execute_plan_direct_action(self, mock_planner_class, mock_api_key):
-        """Test executing plan with direct action."""
-        agent = Agent(api_key=mock_api_key)
-
-        plan = {
-            "goal": "Test goal",
-            "steps": [
-                {
-                    "type": "direct",
-                    "action": "test_action",
-                    "description": "Test step"
-                }
-            ]
-        }
-
-        result = agent.execute_plan(plan)
+    @pytest.mark.parametrize("plan,ok,statuses,error", _PLAN_CASES)
+    def test_execute_plan(self, agent_instance, plan, ok, statuses, error):
+        """Test execute_plan outcomes across the simple step shapes."""
+        result = agent_instance.execute_plan(plan)
 
-        assert result["success"] is True
-        assert len(result["results"]) == 1
-        assert result["results"][0]["status"] == "success"
-        assert result["results"][0]["action"] == "test_action"
+        assert result["success"] is ok
+        assert [r["status"] for r in result["results"]] == statuses
+        if error is not None:
+            assert error in result["results"][0]["error"]
 
-    @patch('agent.Planner')
-    def test_execute_plan_mcp_tool(self, mock_planner_class, mock_api_key):
+    def test_execute_plan_mcp_tool(self, monkeypatch, mock_api_key):
         """Test executing plan with MCP tool."""
+        monkeypatch.setattr('agent.Planner', MagicMock())
         mock_client = MagicMock()
         mock_client.call_tool.return_value = {"output": "success"}
 
@@ -180,9 +274,7 @@ class TestAgent:
         mock_client.call_tool.assert_called_once_with(
             "test_tool", {"param1": "value1"})
 
-    @patch('agent.Planner')
-    @patch('agent.SubAgent')
-    def test_execute_plan_sub_agent(self, mock_sub_agent_class, mock_planner_class, mock_api_key):
+    def test_execute_plan_sub_agent(self, monkeypatch, mock_api_key):
         """Test executing plan with sub-agent."""
         mock_sub_agent = MagicMock()
         mock_sub_agent.execute_task.return_value = {
@@ -190,7 +282,9 @@ class TestAgent:
             "result": "completed",
             "status": "completed"
         }
-        mock_sub_agent_class.return_value = mock_sub_agent
+        mock_sub_agent_class = MagicMock(return_value=mock_sub_agent)
+        monkeypatch.setattr('agent.Planner', MagicMock())
+        monkeypatch.setattr('agent.SubAgent', mock_sub_agent_class)
 
         agent = Agent(api_key=mock_api_key)
 
@@ -210,64 +304,67 @@ class TestAgent:
         assert result["success"] is True
         assert len(result["results"]) == 1
         assert result["results"][0]["status"] == "success"
-        assert len(agent.sub_agents) == 1
+        # The pooled sub-agent is built once and reused
+        mock_sub_agent_class.assert_called_once()
         mock_sub_agent.execute_task.assert_called_once_with("Complete subtask")
 
-    @patch('agent.Planner')
-    def test_execute_plan_mcp_server_not_connected(self, mock_planner_class, mock_api_key):
-        """Test executing plan with MCP tool but server not connected."""
+    def test_execute_plan_batches_sub_agents(self, monkeypatch, mock_api_key):
+        """Test that independent sub-agent steps are batched into one call."""
+        mock_sub_agent = MagicMock()
+        mock_sub_agent.execute_tasks.return_value = [
+            {"task": "Task A", "result": "A", "status": "completed"},
+            {"task": "Task B", "result": "B", "status": "completed"}
+        ]
+        monkeypatch.setattr('agent.Planner', MagicMock())
+        monkeypatch.setattr('agent.SubAgent', MagicMock(return_value=mock_sub_agent))
+
         agent = Agent(api_key=mock_api_key)
 
         plan = {
             "goal": "Test goal",
             "steps": [
-                {
-                    "type": "mcp_tool",
-                    "action": "test_tool",
-                    "mcp_server": "nonexistent_server",
-                    "parameters": {}
-                }
+                {"type": "sub_agent", "action": "a", "task_description": "Task A"},
+                {"type": "sub_agent", "action": "b", "task_description": "Task B"}
             ]
         }
 
         result = agent.execute_plan(plan)
 
-        assert result["success"] is False
-        assert result["results"][0]["status"] == "error"
-        assert "not connected" in result["results"][0]["error"]
+        assert result["success"] is True
+        assert len(result["results"]) == 2
+        mock_sub_agent.execute_tasks.assert_called_once_with(["Task A", "Task B"])
+        mock_sub_agent.execute_task.assert_not_called()
 
-    @patch('agent.Planner')
-    def test_execute_plan_unknown_action_type(self, mock_planner_class, mock_api_key):
-        """Test executing plan with unknown action type."""
+    def test_execute_plan_compiles_repeated_shapes(self, monkeypatch, mock_api_key, sample_plan):
+        """Test that a repeated plan shape gets a compiled runner."""
+        monkeypatch.setattr('agent.Planner', MagicMock())
         agent = Agent(api_key=mock_api_key)
 
-        plan = {
-            "goal": "Test goal",
-            "steps": [
-                {
-                    "type": "unknown_type",
-                    "action": "test_action"
-                }
-            ]
-        }
+        for _ in range(Agent.PLAN_COMPILE_THRESHOLD):
+            result = agent.execute_plan(sample_plan)
+            assert result["success"] is True
 
-        result = agent.execute_plan(plan)
+        fingerprint = Agent._plan_fingerprint(sample_plan["steps"])
+        assert fingerprint in agent._compiled
 
-        assert result["success"] is False
-        assert result["results"][0]["status"] == "error"
-        assert "Unknown action type" in result["results"][0]["error"]
+        # The compiled path produces the same result shape
+        result = agent.execute_plan(sample_plan)
+        assert result["results"][0]["status"] == "success"
+        assert result["results"][0]["result"] == "Direct action: test_action"
 
-    @patch('agent.Planner')
-    def test_execute_plan_multiple_steps(self, mock_planner_class, mock_api_key):
-        """Test executing plan with multiple steps."""
+    def test_execute_plan_with_dependencies(self, monkeypatch, mock_api_key):
+        """Test executing plan where steps declare dependencies."""
+        monkeypatch.setattr('agent.Planner', MagicMock())
         agent = Agent(api_key=mock_api_key)
 
         plan = {
             "goal": "Test goal",
             "steps": [
-                {"type": "direct", "action": "step1"},
-                {"type": "direct", "action": "step2"},
-                {"type": "direct", "action": "step3"}
+                {"step_number": 1, "type": "direct", "action": "step1"},
+                {"step_number": 2, "type": "direct", "action": "step2",
+                 "depends_on": [1]},
+                {"step_number": 3, "type": "direct", "action": "step3",
+                 "depends_on": [1, 2]}
             ]
         }
 
@@ -275,11 +372,27 @@ class TestAgent:
 
         assert result["success"] is True
         assert len(result["results"]) == 3
-        assert all(r["status"] == "success" for r in result["results"])
+        # Results stay ordered by step number
+        assert [r["step"] for r in result["results"]] == [1, 2, 3]
+
+    def test_build_levels_independent_steps(self, monkeypatch, mock_api_key):
+        """Test that steps without dependencies share a single level."""
+        monkeypatch.setattr('agent.Planner', MagicMock())
+        agent = Agent(api_key=mock_api_key)
+
+        steps = [
+            {"step_number": 1, "type": "direct", "action": "a"},
+            {"step_number": 2, "type": "direct", "action": "b"}
+        ]
+
+        levels = agent._build_levels(steps)
 
-    @patch('agent.Planner')
-    def test_execute_plan_with_error(self, mock_planner_class, mock_api_key):
+        assert len(levels) == 1
+        assert len(levels[0]) == 2
+
+    def test_execute_plan_with_error(self, monkeypatch, mock_api_key):
         """Test executing plan where one step fails."""
+        monkeypatch.setattr('agent.Planner', MagicMock())
         agent = Agent(api_key=mock_api_key)
 
         plan = {
@@ -294,22 +407,19 @@ class TestAgent:
         result = agent.execute_plan(plan)
 
         assert result["success"] is False
-        assert len(result["results"]) == 3
-        assert result["results"][0]["status"] == "success"
-        assert result["results"][1]["status"] == "error"
-        assert result["results"][2]["status"] == "success"
+        assert [r["status"] for r in result["results"]] == [
+            "success", "error", "success"]
 
-    @patch('agent.Planner')
-    def test_run_full_workflow(self, mock_planner_class, mock_api_key):
+    def test_run_full_workflow(self, mocker, mock_api_key):
         """Test full run workflow."""
-        mock_planner = MagicMock()
-        mock_planner.create_plan.return_value = {
+        planner_cls = mocker.patch('agent.Planner')
+        planner_cls.return_value.create_plan.return_value = {
             "goal": "Test goal",
             "steps": [
                 {"type": "direct", "action": "test_action"}
             ]
         }
-        mock_planner_class.return_value = mock_planner
+        mock_planner = planner_cls.return_value
 
         agent = Agent(api_key=mock_api_key)
 
@@ -321,9 +431,27 @@ class TestAgent:
         call_args = mock_planner.create_plan.call_args
         assert call_args[0][0] == "Test prompt"
 
-    @patch('agent.Planner')
-    def test_cleanup(self, mock_planner_class, mock_api_key):
+    def test_run_stream_executes_steps_as_streamed(self, monkeypatch, mock_api_key):
+        """Test that run_stream executes each step yielded by the planner."""
+        mock_planner = MagicMock()
+        mock_planner.stream_plan.return_value = iter([
+            {"step_number": 1, "type": "direct", "action": "step1"},
+            {"step_number": 2, "type": "direct", "action": "step2"}
+        ])
+        monkeypatch.setattr('agent.Planner', MagicMock(return_value=mock_planner))
+
+        agent = Agent(api_key=mock_api_key)
+
+        result = agent.run_stream("Test prompt")
+
+        assert result["success"] is True
+        assert len(result["results"]) == 2
+        assert [r["action"] for r in result["results"]] == ["step1", "step2"]
+        mock_planner.stream_plan.assert_called_once()
+
+    def test_cleanup(self, monkeypatch, mock_api_key):
         """Test cleanup of resources."""
+        monkeypatch.setattr('agent.Planner', MagicMock())
         mock_client1 = MagicMock()
         mock_client2 = MagicMock()
 
@@ -336,9 +464,9 @@ class TestAgent:
         mock_client1.disconnect.assert_called_once()
         mock_client2.disconnect.assert_called_once()
 
-    @patch('agent.Planner')
-    def test_cleanup_with_error(self, mock_planner_class, mock_api_key):
+    def test_cleanup_with_error(self, monkeypatch, mock_api_key):
         """Test cleanup handles errors gracefully."""
+        monkeypatch.setattr('agent.Planner', MagicMock())
         mock_client1 = MagicMock()
         mock_client1.disconnect.side_effect = Exception("Disconnect error")
         mock_client2 = MagicMock()
@@ -0,0 +1,38 @@
+"""
+Tests for the logger module.
+"""
+
+import logging
+import logging.handlers
+import pytest
+from logger import setup_logger
+
+
+class TestLogger:
+    """Test cases for the shared queue-based logger."""
+
+    def test_setup_logger_configures_handlers(self):
+        """Test that the logger gets a queue handler on first setup."""
+        logger = setup_logger()
+
+        assert logger.handlers
+        assert isinstance(logger.handlers[0], logging.handlers.QueueHandler)
+
+    def test_setup_logger_idempotent(self):
+        """Test that repeated setup reuses the configured logger."""
+        first = setup_logger()
+        second = setup_logger()
+
+        assert first is second
+        # Only one queue handler regardless of how often setup runs
+        # (pytest adds its own capture handlers to the logger)
+        queue_handlers = [h for h in first.handlers
+                          if isinstance(h, logging.handlers.QueueHandler)]
+        assert len(queue_handlers) == 1
+
+    def test_setup_logger_levels(self):
+        """Test that log records flow without raising."""
+        logger = setup_logger()
+        logger.info("info message")
+        logger.warning("warning message")
+        logger.error("error message")
@@ -2,16 +2,52 @@
 Tests for the MCPClient module.
 """
 
+import re
 import subprocess
 import json
-from unittest.mock import Mock, MagicMock, patch
+from types import SimpleNamespace
+from unittest.mock import Mock, patch
 import pytest
 from mcp_client import MCPClient
 import sys
-import os
 
-# Add src to path BEFORE importing
-sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+# Compiled once; pytest.raises accepts precompiled match patterns
+_RE_CONNECT_FAILED = re.compile("Failed to connect")
+_RE_NOT_CONNECTED = re.compile("MCP server not connected")
+
+# Canned JSON-RPC response lines, serialized once at import instead of
+# per test
+_OK_LINE = json.dumps({"result": {"status": "ok"}}) + "\n"
+_TOOLS_LINE = json.dumps(
+    {"result": {"tools": [{"name": "tool1", "description": "Tool 1"}]}}) + "\n"
+# Built once; exception construction formats a message per instance
+_TIMEOUT_EXC = subprocess.TimeoutExpired("cmd", 5)
+
+
+def _build_mock_process():
+    """Build a fake server process with plain Mock pipes."""
+    stdout = Mock()
+    stdout.readline.return_value = _OK_LINE
+    # spec_set limits stdin to the two methods the client may call and
+    # skips mock's attribute synthesis for everything else
+    return SimpleNamespace(stdin=Mock(spec_set=['write', 'flush']), stdout=stdout,
+                           wait=Mock(return_value=0), terminate=Mock(),
+                           kill=Mock())
+
+
+@pytest.fixture
+def connected_client(monkeypatch):
+    """An MCPClient connected to a prebuilt fake server process.
+
+    Consolidates the per-test Popen scaffolding into one fixture; tests
+    reconfigure proc.stdout.readline for their own responses.
+    """
+    proc = _build_mock_process()
+    monkeypatch.setattr('mcp_client.subprocess.Popen', lambda *a, **k: proc)
+    client = MCPClient("/path/to/server")
+    client.connect()
+    return client, proc
 
 
 class TestMCPClient:
@@ -31,29 +67,13 @@ class TestMCPClient:
         assert client.server_path == "/path/to/server"
         assert client.args == []
 
-    @patch('time.sleep')
-    @patch('mcp_client.subprocess.Popen')
-    def test_connect_success(self, mock_popen, mock_sleep):
+    def test_connect_success(self, connected_client):
         """Test successful MCP server connection."""
-        # Mock process
-        mock_process = MagicMock()
-        mock_stdin = MagicMock()
-        mock_stdout = MagicMock()
-        mock_process.stdin = mock_stdin
-        mock_process.stdout = mock_stdout
-        # First call is for initialize, second for any subsequent calls
-        mock_stdout.readline.side_effect = [
-            json.dumps({"result": {"status": "ok"}}) + "\n",
-            json.dumps({"result": {"status": "ok"}}) + "\n"
-        ]
-        mock_popen.return_value = mock_process
+        client, proc = connected_client
 
-        client = MCPClient("/path/to/server")
-        client.connect()
-
-        assert client.process is not None
-        mock_popen.assert_called_once()
-        mock_sleep.assert_called_once()
+        assert client.process is proc
+        # The initialize round-trip consumed one response line
+        proc.stdout.readline.assert_called_once()
 
     @patch('mcp_client.subprocess.Popen')
     def test_connect_failure(self, mock_popen):
@@ -62,12 +82,112 @@ class TestMCPClient:
 
         client = MCPClient("/path/to/server")
 
-        with pytest.raises(ConnectionError, match="Failed to connect"):
+        with pytest.raises(ConnectionError, match=_RE_CONNECT_FAILED):
             client.connect()
 
+    def test_list_tools_cached(self, connected_client):
+        """Test that list_tools only pays one RPC for repeated calls."""
+        client, proc = connected_client
+        # Exactly one response is queued; a second RPC would exhaust the
+        # side_effect list and fail loudly instead of passing silently
+        proc.stdout.readline.side_effect = [_TOOLS_LINE]
+
+        first = client.list_tools()
+        second = client.list_tools()
+
+        assert first == second == [{"name": "tool1", "description": "Tool 1"}]
+        # One readline for initialize, one for tools/list
+        assert proc.stdout.readline.call_count == 2
+
+    @pytest.mark.parametrize("readline_ret,expected", [
+        pytest.param(_OK_LINE, {"result": {"status": "ok"}}, id="response"),
+        pytest.param("", {"error": "No response from server"}, id="no_response"),
+    ])
+    def test_send_request(self, connected_client, readline_ret, expected):
+        """Test the happy and empty-response paths of _send_request."""
+        client, proc = connected_client
+        proc.stdout.readline.return_value = readline_ret
+
+        assert client._send_request({"method": "t", "params": {}}) == expected
+
     def test_send_request_not_connected(self):
         """Test sending request when not connected."""
         client = MCPClient("/path/to/server")
 
-        with pytest.raises(ConnectionError, match="MCP server not connected"):
+        with pytest.raises(ConnectionError, match=_RE_NOT_CONNECTED):
             client._send_request({"method": "test", "params": {}})
+
+    def test_disconnect_kill_on_timeout(self, connected_client):
+        """Test that a hung server is killed when terminate times out."""
+        client, proc = connected_client
+        proc.wait.side_effect = _TIMEOUT_EXC
+
+        client.disconnect()
+
+        proc.terminate.assert_called_once()
+        proc.kill.assert_called_once()
+        assert client.process is None
+
+    def test_json_helpers_round_trip(self):
+        """Test that the JSON helpers round-trip RPC messages."""
+        from mcp_client import _dumps, _loads
+
+        message = {"jsonrpc": "2.0", "id": 7, "method": "tools/call",
+                   "params": {"name": "t", "arguments": {"a": 1}}}
+
+        assert _loads(_dumps(message)) == message
+
+    def test_send_request_async_not_connected(self):
+        """Test sending async request when not connected."""
+        import asyncio
+
+        client = MCPClient("/path/to/server")
+
+        with pytest.raises(ConnectionError, match=_RE_NOT_CONNECTED):
+            asyncio.run(client._send_request_async(
+                {"method": "test", "params": {}}))
+
+    def test_adaptive_concurrency_limits(self):
+        """Test AIMD adjustment of the async concurrency limit."""
+        client = MCPClient("/path/to/server", max_concurrency=4)
+
+        client._shrink()
+        assert client._limit == 2
+        client._shrink()
+        client._shrink()
+        assert client._limit == 1
+
+        for _ in range(MCPClient.GROWTH_THRESHOLD):
+            client._grow()
+        assert client._limit == 2
+
+    def test_async_connect_and_call(self):
+        """Test async connect, tool call, and disconnect against an echo server."""
+        import asyncio
+
+        # Minimal line-based JSON-RPC server that echoes the request method
+        server_script = (
+            "import sys, json\n"
+            "for line in sys.stdin:\n"
+            "    req = json.loads(line)\n"
+            "    resp = {'jsonrpc': '2.0', 'id': req.get('id'),\n"
+            "            'result': {'echo': req.get('method')}}\n"
+            "    sys.stdout.write(json.dumps(resp) + '\\n')\n"
+            "    sys.stdout.flush()\n"
+        )
+
+        async def scenario():
+            client = MCPClient(sys.executable, ["-c", server_script])
+            await client.connect_async()
+            try:
+                # Concurrent calls multiplex over the same pipe
+                results = await asyncio.gather(
+                    client.call_tool_async("tool_a", {}),
+                    client.call_tool_async("tool_b", {})
+                )
+                return results
+            finally:
+                await client.disconnect_async()
+
+        results = asyncio.run(scenario())
+        assert results == [{"echo": "tools/call"}, {"echo": "tools/call"}]
@@ -2,156 +2,276 @@
 Tests for the Planner module.
 """
 
-from unittest.mock import Mock, MagicMock, patch
-import json
+import re
+from unittest.mock import Mock, MagicMock
+import jsonschema
+import orjson
 import pytest
+from openai import OpenAI
+from conftest import FakeOpenAI
 from planner import Planner
-import sys
-import os
 
-# Add src to path BEFORE importing
-sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+def _dumps(obj) -> str:
+    """Serialize fake LLM payloads with orjson's C encoder."""
+    return orjson.dumps(obj).decode()
+
+
+# Tool catalogs reused across tests; the empty tuple avoids allocating
+# a fresh list per call
+_EMPTY_TOOLS = ()
+
+# Anchored line pattern compiled once; a description-less tool formats
+# as a bare "- <name>" line
+_TOOL_LINE_RE = re.compile(r"^- tool1$", re.M)
+
+# Compiled once at import and reused by every plan test; schema
+# compilation is the expensive half of jsonschema validation
+PLAN_VALIDATOR = jsonschema.Draft7Validator({
+    "type": "object",
+    "required": ["goal", "steps"],
+    "properties": {"steps": {"type": "array"}}
+})
+
+# Plan payloads serialized once at import instead of inside each test run
+_PLAN_SUCCESS_JSON = _dumps({
+    "goal": "Test goal",
+    "steps": [
+        {
+            "step_number": 1,
+            "type": "direct",
+            "action": "test_action",
+            "description": "Test step"
+        }
+    ]
+})
+_PLAN_TOOLS_JSON = _dumps({
+    "goal": "Use tools",
+    "steps": [
+        {
+            "step_number": 1,
+            "type": "mcp_tool",
+            "action": "test_tool",
+            "mcp_server": "test_server",
+            "parameters": {"param1": "value1"},
+            "description": "Use test tool"
+        }
+    ]
+})
+_PLAN_MISSING_STEPS_JSON = _dumps({"goal": "Test goal"})
+_PLAN_EMPTY_JSON = _dumps({"goal": "g", "steps": []})
+_STREAM_PLAN_JSON = _dumps({
+    "goal": "Test goal",
+    "steps": [
+        {"step_number": 1, "type": "direct", "action": "a"},
+        {"step_number": 2, "type": "direct", "action": "b"}
+    ]
+})
+
+# (response_text, with_tools, expected_goal, expected_first_step, raises)
+# table for the create_plan happy/error paths; expected_first_step is a
+# subset of the first step's fields, or None for an empty steps list
+_CREATE_PLAN_CASES = [
+    pytest.param(
+        _PLAN_SUCCESS_JSON,
+        False, "Test goal", {"type": "direct"}, None,
+        id="success"),
+    pytest.param(
+        _PLAN_TOOLS_JSON,
+        True, "Use tools", {"type": "mcp_tool", "mcp_server": "test_server"}, None,
+        id="with_tools"),
+    pytest.param(
+        "not valid json",
+        False, "Test task", {"type": "direct"}, None,
+        id="json_decode_error"),
+    pytest.param(
+        _PLAN_MISSING_STEPS_JSON,
+        False, "Test goal", None, None,
+        id="missing_fields"),
+    pytest.param(
+        None,
+        False, None, None, Exception("API Error"),
+        id="api_error"),
+]
 
 
 class TestPlanner:
     """Test cases for Planner class."""
 
-    @patch('planner.OpenAI')
-    def test_init(self, mock_openai_class, mock_api_key):
+    def test_init(self, monkeypatch, mock_api_key):
         """Test planner initialization."""
-        mock_client = MagicMock()
-        mock_openai_class.return_value = mock_client
+        constructed = []
+        # spec_set skips MagicMock's magic-protocol children and rejects
+        # attributes the real client does not have
+        mock_client = Mock(spec_set=OpenAI)
+        monkeypatch.setattr(
+            'planner.OpenAI',
+            lambda **kwargs: constructed.append(kwargs) or mock_client)
         planner = Planner(mock_api_key, "gpt-4o-mini")
         assert planner.model == "gpt-4o-mini"
-        assert planner.client is not None
-        mock_openai_class.assert_called_once_with(api_key=mock_api_key)
-
-    @patch('planner.OpenAI')
-    def test_create_plan_success(self, mock_openai_class, mock_api_key, mock_openai_response):
-        """Test successful plan creation."""
-        # Setup mock
-        mock_client = MagicMock()
-        mock_openai_class.return_value = mock_client
-
-        plan_json = json.dumps({
-            "goal": "Test goal",
-            "steps": [
-                {
-                    "step_number": 1,
-                    "type": "direct",
-                    "action": "test_action",
-                    "description": "Test step"
-                }
-            ]
-        })
+        assert planner.client is mock_client
+        assert constructed == [{"api_key": mock_api_key}]
 
-        mock_response = mock_openai_response(plan_json)
-        mock_client.chat.completions.create.return_value = mock_response
+    @pytest.mark.parametrize(
+        "response_text,with_tools,goal,first_step,raises", _CREATE_PLAN_CASES)
+    def test_create_plan(self, monkeypatch, mock_api_key, mock_openai_response,
+                         sample_tools, response_text, with_tools, goal,
+                         first_step, raises):
+        """Test create_plan across the happy, fallback, and error paths."""
+        if raises is not None:
+            fake = FakeOpenAI(raises)
+        else:
+            fake = FakeOpenAI(mock_openai_response(response_text))
+        monkeypatch.setattr('planner.OpenAI', lambda **kwargs: fake)
 
-        # Test
         planner = Planner(mock_api_key)
-        available_tools = []
-        plan = planner.create_plan("Test task", available_tools)
-
-        # Verify
-        assert plan["goal"] == "Test goal"
-        assert len(plan["steps"]) == 1
-        assert plan["steps"][0]["type"] == "direct"
-        mock_client.chat.completions.create.assert_called_once()
-
-    @patch('planner.OpenAI')
-    def test_create_plan_with_tools(self, mock_openai_class, mock_api_key, mock_openai_response, sample_tools):
-        """Test plan creation with available tools."""
-        mock_client = MagicMock()
-        mock_openai_class.return_value = mock_client
-
-        plan_json = json.dumps({
-            "goal": "Use tools",
+        tools = sample_tools if with_tools else _EMPTY_TOOLS
+
+        if raises is not None:
+            # Literal substring check; match= would re.compile per run
+            with pytest.raises(Exception) as exc:
+                planner.create_plan("Test task", tools)
+            assert "API Error" in str(exc.value)
+            return
+
+        plan = planner.create_plan("Test task", tools)
+
+        PLAN_VALIDATOR.validate(plan)
+        assert plan["goal"] == goal
+        if first_step is None:
+            # Missing fields are normalized to an empty steps list
+            assert plan["steps"] == []
+        else:
+            assert len(plan["steps"]) == 1
+            for key, value in first_step.items():
+                assert plan["steps"][0][key] == value
+        assert len(fake.calls) == 1
+
+    def test_create_plan_tool_call_response(self, monkeypatch, mock_api_key):
+        """Test plan creation from a structured tool-call response."""
+        plan = {
+            "goal": "Tool-call goal",
             "steps": [
-                {
-                    "step_number": 1,
-                    "type": "mcp_tool",
-                    "action": "test_tool",
-                    "mcp_server": "test_server",
-                    "parameters": {"param1": "value1"},
-                    "description": "Use test tool"
-                }
+                {"step_number": 1, "type": "direct", "action": "do_it"}
             ]
-        })
+        }
+
+        mock_tool_call = Mock()
+        mock_tool_call.function.arguments = _dumps(plan)
+        mock_choice = Mock()
+        mock_choice.message.content = None
+        mock_choice.message.tool_calls = [mock_tool_call]
+        mock_response = Mock()
+        mock_response.choices = [mock_choice]
 
-        mock_response = mock_openai_response(plan_json)
-        mock_client.chat.completions.create.return_value = mock_response
+        fake = FakeOpenAI(mock_response)
+        monkeypatch.setattr('planner.OpenAI', lambda **kwargs: fake)
 
         planner = Planner(mock_api_key)
-        plan = planner.create_plan("Use a tool", sample_tools)
+        result = planner.create_plan("Test task", _EMPTY_TOOLS)
 
-        assert plan["goal"] == "Use tools"
-        assert plan["steps"][0]["type"] == "mcp_tool"
-        assert plan["steps"][0]["mcp_server"] == "test_server"
+        PLAN_VALIDATOR.validate(result)
+        assert result == plan
+        assert fake.calls[0]["tool_choice"]["function"]["name"] == "emit_plan"
 
-    @patch('planner.OpenAI')
-    def test_create_plan_json_decode_error(self, mock_openai_class, mock_api_key, mock_openai_response):
-        """Test plan creation with invalid JSON response."""
-        mock_client = MagicMock()
-        mock_openai_class.return_value = mock_client
+    def test_create_plan_cache_hit(self, monkeypatch, mock_api_key):
+        """Test that a plan cache hit skips the LLM call."""
+        fake = FakeOpenAI()
+        monkeypatch.setattr('planner.OpenAI', lambda **kwargs: fake)
 
-        # Return invalid JSON
-        mock_response = mock_openai_response("not valid json")
-        mock_client.chat.completions.create.return_value = mock_response
+        cached_plan = {"goal": "Cached goal", "steps": []}
+        mock_cache = MagicMock()
+        mock_cache.get.return_value = cached_plan
 
-        planner = Planner(mock_api_key)
-        plan = planner.create_plan("Test task", [])
+        planner = Planner(mock_api_key, plan_cache=mock_cache)
+        plan = planner.create_plan("Test task", _EMPTY_TOOLS)
 
-        # Should return fallback plan
-        assert plan["goal"] == "Test task"
-        assert len(plan["steps"]) == 1
-        assert plan["steps"][0]["type"] == "direct"
+        assert plan == cached_plan
+        assert fake.calls == []
 
-    @patch('planner.OpenAI')
-    def test_create_plan_missing_fields(self, mock_openai_class, mock_api_key, mock_openai_response):
-        """Test plan creation with missing fields in response."""
-        mock_client = MagicMock()
-        mock_openai_class.return_value = mock_client
+    def test_create_plan_cache_miss_stores_plan(self, monkeypatch, mock_api_key, mock_openai_response):
+        """Test that a cache miss calls the LLM and stores the result."""
+        plan_json = _dumps({"goal": "New goal", "steps": []})
+        fake = FakeOpenAI(mock_openai_response(plan_json))
+        monkeypatch.setattr('planner.OpenAI', lambda **kwargs: fake)
 
-        # Plan missing "steps" field
-        plan_json = json.dumps({"goal": "Test goal"})
-        mock_response = mock_openai_response(plan_json)
-        mock_client.chat.completions.create.return_value = mock_response
+        mock_cache = MagicMock()
+        mock_cache.get.return_value = None
 
-        planner = Planner(mock_api_key)
-        plan = planner.create_plan("Test task", [])
+        planner = Planner(mock_api_key, plan_cache=mock_cache)
+        plan = planner.create_plan("Test task", _EMPTY_TOOLS)
+
+        assert plan["goal"] == "New goal"
+        mock_cache.put.assert_called_once()
+
+    def test_create_plan_exact_cache_repeat(self, monkeypatch, mock_api_key, mock_openai_response):
+        """Test that an identical prompt reuses the exact-match cache."""
+        from llm_cache import LLMCache
+
+        plan_json = _dumps({"goal": "Test goal", "steps": []})
+        fake = FakeOpenAI(mock_openai_response(plan_json))
+        monkeypatch.setattr('planner.OpenAI', lambda **kwargs: fake)
+
+        planner = Planner(mock_api_key, llm_cache=LLMCache())
+
+        first = planner.create_plan("Test task", _EMPTY_TOOLS)
+        second = planner.create_plan("Test task", _EMPTY_TOOLS)
 
-        # Should normalize with empty steps
-        assert plan["goal"] == "Test goal"
-        assert "steps" in plan
-        assert plan["steps"] == []
+        assert first == second
+        assert len(fake.calls) == 1
 
-    @patch('planner.OpenAI')
-    def test_create_plan_api_error(self, mock_openai_class, mock_api_key):
-        """Test plan creation when API call fails."""
-        mock_client = MagicMock()
-        mock_openai_class.return_value = mock_client
-        mock_client.chat.completions.create.side_effect = Exception(
-            "API Error")
+    def test_parse_partial_steps_incomplete_tail(self):
+        """Test that only fully decoded steps are extracted from a prefix."""
+        buffer = ('{"goal": "g", "steps": [{"step_number": 1, "type": "direct"},'
+                  ' {"step_number": 2, "ty')
+
+        steps = Planner._parse_partial_steps(buffer)
+
+        assert steps == [{"step_number": 1, "type": "direct"}]
+
+    def test_parse_partial_steps_no_steps_yet(self):
+        """Test partial parsing before the steps array has streamed in."""
+        assert Planner._parse_partial_steps('{"goal": "g"') == []
+        assert Planner._parse_partial_steps('{"goal": "g", "steps"') == []
+
+    def test_stream_plan_yields_steps_incrementally(self, monkeypatch, mock_api_key):
+        """Test that stream_plan yields each step as its JSON completes."""
+        def make_chunk(content):
+            chunk = Mock()
+            chunk.choices = [Mock()]
+            chunk.choices[0].delta.content = content
+            return chunk
+
+        # Stream the plan in small pieces
+        chunks = [make_chunk(_STREAM_PLAN_JSON[i:i + 7])
+                  for i in range(0, len(_STREAM_PLAN_JSON), 7)]
+        fake = FakeOpenAI(iter(chunks))
+        monkeypatch.setattr('planner.OpenAI', lambda **kwargs: fake)
 
         planner = Planner(mock_api_key)
+        steps = list(planner.stream_plan("Test task", _EMPTY_TOOLS))
 
-        with pytest.raises(Exception, match="API Error"):
-            planner.create_plan("Test task", [])
+        assert len(steps) == 2
+        assert steps[0]["action"] == "a"
+        assert steps[1]["action"] == "b"
+        assert fake.calls[0]["stream"] is True
 
-    @patch('planner.OpenAI')
-    def test_format_tools_empty(self, mock_openai_class, mock_api_key):
+    def test_tools_fingerprint_order_independent(self, sample_tools):
+        """Test that the tools fingerprint ignores catalog ordering."""
+        from plan_cache import PlanCache
+
+        forward = PlanCache.tools_fingerprint(sample_tools)
+        reversed_fp = PlanCache.tools_fingerprint(list(reversed(sample_tools)))
+
+        assert forward == reversed_fp
+
+    def test_format_tools_empty(self, shared_planner):
         """Test formatting empty tools list."""
-        mock_openai_class.return_value = MagicMock()
-        planner = Planner(mock_api_key)
-        result = planner._format_tools([])
+        result = shared_planner._format_tools([])
         assert result == "No tools available."
 
-    @patch('planner.OpenAI')
-    def test_format_tools_single(self, mock_openai_class, mock_api_key):
+    def test_format_tools_single(self, shared_planner):
         """Test formatting single tool."""
-        mock_openai_class.return_value = MagicMock()
-        planner = Planner(mock_api_key)
         tools = [
             {
                 "name": "test_tool",
@@ -159,32 +279,47 @@ class TestPlanner:
                 "mcp_server": "test_server"
             }
         ]
-        result = planner._format_tools(tools)
+        result = shared_planner._format_tools(tools)
         assert "test_tool" in result
         assert "A test tool" in result
         assert "test_server" in result
 
-    @patch('planner.OpenAI')
-    def test_format_tools_multiple(self, mock_openai_class, mock_api_key):
+    def test_format_tools_multiple(self, shared_planner):
         """Test formatting multiple tools."""
-        mock_openai_class.return_value = MagicMock()
-        planner = Planner(mock_api_key)
         tools = [
             {"name": "tool1", "description": "First tool"},
             {"name": "tool2", "description": "Second tool", "mcp_server": "server1"}
         ]
-        result = planner._format_tools(tools)
+        result = shared_planner._format_tools(tools)
         assert "tool1" in result
         assert "tool2" in result
         assert "First tool" in result
         assert "Second tool" in result
 
-    @patch('planner.OpenAI')
-    def test_format_tools_no_description(self, mock_openai_class, mock_api_key):
-        """Test formatting tools without description."""
-        mock_openai_class.return_value = MagicMock()
+    def test_format_tools_canonical_order(self, shared_planner):
+        """Test that tool ordering does not change the formatted output."""
+        tools = [
+            {"name": "zeta_tool", "description": "Last tool"},
+            {"name": "alpha_tool", "description": "First tool"}
+        ]
+        result = shared_planner._format_tools(tools)
+        assert result == shared_planner._format_tools(list(reversed(tools)))
+        assert result.index("alpha_tool") < result.index("zeta_tool")
+
+    def test_create_plan_tools_in_system_prompt(self, monkeypatch, mock_api_key, mock_openai_response, sample_tools):
+        """Test that the tool catalog lives in the stable system message."""
+        fake = FakeOpenAI(mock_openai_response(_PLAN_EMPTY_JSON))
+        monkeypatch.setattr('planner.OpenAI', lambda **kwargs: fake)
+
         planner = Planner(mock_api_key)
+        planner.create_plan("Do the thing", sample_tools)
+
+        messages = fake.calls[0]["messages"]
+        assert "test_tool" in messages[0]["content"]
+        assert messages[1]["content"] == "Task: Do the thing"
+
+    def test_format_tools_no_description(self, shared_planner):
+        """Test formatting tools without description."""
         tools = [{"name": "tool1"}]
-        result = planner._format_tools(tools)
-        assert "tool1" in result
-        assert "- tool1" in result or "tool1" in result
+        result = shared_planner._format_tools(tools)
+        assert _TOOL_LINE_RE.search(result)
@@ -0,0 +1,69 @@
+"""
+Tests for the RateLimiter module.
+"""
+
+import time
+from unittest.mock import MagicMock
+import pytest
+from rate_limiter import RateLimiter
+
+
+class TestRateLimiter:
+    """Test cases for RateLimiter class."""
+
+    def test_init(self):
+        """Test limiter initialization."""
+        limiter = RateLimiter(max_rpm=100, max_tpm=10000)
+        assert limiter.max_rpm == 100
+        assert limiter.max_tpm == 10000
+
+    def test_estimate_tokens(self):
+        """Test the rough token estimate."""
+        assert RateLimiter.estimate_tokens("") == 1
+        assert RateLimiter.estimate_tokens("a" * 400) == 100
+
+    def test_acquire_within_budget(self):
+        """Test that acquire returns immediately when budget is available."""
+        limiter = RateLimiter(max_rpm=60, max_tpm=6000)
+
+        start = time.monotonic()
+        limiter.acquire(est_tokens=100)
+        elapsed = time.monotonic() - start
+
+        assert elapsed < 0.1
+
+    def test_acquire_consumes_budget(self):
+        """Test that acquire drains both buckets."""
+        limiter = RateLimiter(max_rpm=60, max_tpm=6000)
+
+        limiter.acquire(est_tokens=100)
+
+        assert limiter._requests <= 59
+        assert limiter._tokens <= 5900
+
+    def test_acquire_blocks_when_exhausted(self):
+        """Test that an exhausted bucket makes acquire wait for refill."""
+        limiter = RateLimiter(max_rpm=6000, max_tpm=600_000)
+        limiter._requests = 0.0
+
+        start = time.monotonic()
+        limiter.acquire()
+        elapsed = time.monotonic() - start
+
+        # One request refills in 60/6000 = 10ms
+        assert elapsed >= 0.005
+
+    def test_planner_acquires_before_call(self, monkeypatch, mock_api_key, mock_openai_response):
+        """Test that the planner throttles through a shared limiter."""
+        from planner import Planner
+
+        mock_client = MagicMock()
+        monkeypatch.setattr('planner.OpenAI', lambda **kwargs: mock_client)
+        mock_client.chat.completions.create.return_value = mock_openai_response(
+            '{"goal": "g", "steps": []}')
+
+        limiter = MagicMock()
+        planner = Planner(mock_api_key, rate_limiter=limiter)
+        planner.create_plan("Test task", [])
+
+        limiter.acquire.assert_called_once()
@@ -2,55 +2,59 @@
 Tests for the SubAgent module.
 """
 
-from unittest.mock import Mock, MagicMock, patch
+from unittest.mock import Mock
 import pytest
+from openai import OpenAI
+from conftest import EMPTY_RESPONSE, FakeOpenAI
 from sub_agent import SubAgent
-import sys
-import os
 
-# Add src to path BEFORE importing
-sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+@pytest.fixture
+def sub_agent_with_fake(mock_api_key, monkeypatch):
+    """A SubAgent wired to a recording FakeOpenAI client.
+
+    Consolidates the per-test patch-and-construct scaffolding; tests
+    queue their canned responses with fake.respond_with(...).
+    """
+    fake = FakeOpenAI()
+    monkeypatch.setattr('sub_agent.OpenAI', lambda **kwargs: fake)
+    return SubAgent(mock_api_key), fake
 
 
 class TestSubAgent:
     """Test cases for SubAgent class."""
 
-    @patch('sub_agent.OpenAI')
-    def test_init(self, mock_openai_class, mock_api_key):
+    def test_init(self, monkeypatch, mock_api_key):
         """Test sub-agent initialization."""
-        mock_client = MagicMock()
-        mock_openai_class.return_value = mock_client
+        constructed = []
+        # spec_set skips MagicMock's magic-protocol children and rejects
+        # attributes the real client does not have
+        mock_client = Mock(spec_set=OpenAI)
+        monkeypatch.setattr(
+            'sub_agent.OpenAI',
+            lambda **kwargs: constructed.append(kwargs) or mock_client)
         agent = SubAgent(mock_api_key, "gpt-4o-mini")
         assert agent.model == "gpt-4o-mini"
-        assert agent.client is not None
-        mock_openai_class.assert_called_once_with(api_key=mock_api_key)
+        assert agent.client is mock_client
+        assert constructed == [{"api_key": mock_api_key}]
 
-    @patch('sub_agent.OpenAI')
-    def test_execute_task_success(self, mock_openai_class, mock_api_key, mock_openai_response):
+    def test_execute_task_success(self, sub_agent_with_fake, mock_openai_response):
         """Test successful task execution."""
-        mock_client = MagicMock()
-        mock_openai_class.return_value = mock_client
+        agent, fake = sub_agent_with_fake
+        fake.respond_with(mock_openai_response("Task completed successfully"))
 
-        mock_response = mock_openai_response("Task completed successfully")
-        mock_client.chat.completions.create.return_value = mock_response
-
-        agent = SubAgent(mock_api_key)
         result = agent.execute_task("Test task")
 
         assert result["task"] == "Test task"
         assert result["status"] == "completed"
         assert result["result"] == "Task completed successfully"
-        mock_client.chat.completions.create.assert_called_once()
+        assert len(fake.calls) == 1
 
-    @patch('sub_agent.OpenAI')
-    def test_execute_task_api_error(self, mock_openai_class, mock_api_key):
+    def test_execute_task_api_error(self, sub_agent_with_fake):
         """Test task execution when API call fails."""
-        mock_client = MagicMock()
-        mock_openai_class.return_value = mock_client
-        mock_client.chat.completions.create.side_effect = Exception(
-            "API Error")
+        agent, fake = sub_agent_with_fake
+        fake.respond_with(Exception("API Error"))
 
-        agent = SubAgent(mock_api_key)
         result = agent.execute_task("Test task")
 
         assert result["task"] == "Test task"
@@ -59,29 +63,106 @@ class TestSubAgent:
         assert "error" in result
         assert "API Error" in result["error"]
 
-    @patch('sub_agent.OpenAI')
-    def test_execute_task_empty_response(self, mock_openai_class, mock_api_key, mock_openai_response):
+    def test_execute_task_empty_response(self, sub_agent_with_fake):
         """Test task execution with empty response."""
-        mock_client = MagicMock()
-        mock_openai_class.return_value = mock_client
-
-        mock_response = mock_openai_response("")
-        mock_client.chat.completions.create.return_value = mock_response
+        agent, fake = sub_agent_with_fake
+        fake.respond_with(EMPTY_RESPONSE)
 
-        agent = SubAgent(mock_api_key)
         result = agent.execute_task("Test task")
 
         assert result["status"] == "completed"
         assert result["result"] == ""
 
-    @patch('sub_agent.OpenAI')
-    def test_execute_task_different_models(self, mock_openai_class, mock_api_key, mock_openai_response):
-        """Test sub-agent with different models."""
-        mock_client = MagicMock()
-        mock_openai_class.return_value = mock_client
+    def test_init_with_shared_client(self, monkeypatch, mock_api_key):
+        """Test that an injected client is used instead of building one."""
+        constructed = []
+        monkeypatch.setattr(
+            'sub_agent.OpenAI', lambda **kwargs: constructed.append(kwargs))
+        shared_client = Mock(spec_set=OpenAI)
+
+        agent = SubAgent(mock_api_key, openai_client=shared_client)
+
+        assert agent.client is shared_client
+        assert constructed == []
+
+    def test_execute_task_cache_hit(self, monkeypatch, mock_api_key, mock_openai_response):
+        """Test that a repeated task is served from the cache."""
+        from llm_cache import LLMCache
+
+        fake = FakeOpenAI(mock_openai_response("First result"))
+        monkeypatch.setattr('sub_agent.OpenAI', lambda **kwargs: fake)
+
+        agent = SubAgent(mock_api_key, cache=LLMCache())
+
+        first = agent.execute_task("Test task")
+        second = agent.execute_task("Test task")
+
+        assert first == second
+        # Only the first call hits the API
+        assert len(fake.calls) == 1
+
+    def test_execute_task_error_not_cached(self, monkeypatch, mock_api_key, mock_openai_response):
+        """Test that failed tasks are not cached."""
+        from llm_cache import LLMCache
+
+        fake = FakeOpenAI(
+            Exception("API Error"),
+            mock_openai_response("Recovered")
+        )
+        monkeypatch.setattr('sub_agent.OpenAI', lambda **kwargs: fake)
 
-        mock_response = mock_openai_response("Result")
-        mock_client.chat.completions.create.return_value = mock_response
+        agent = SubAgent(mock_api_key, cache=LLMCache())
+
+        first = agent.execute_task("Test task")
+        second = agent.execute_task("Test task")
+
+        assert first["status"] == "error"
+        assert second["status"] == "completed"
+
+    def test_execute_tasks_batched(self, sub_agent_with_fake, mock_openai_response):
+        """Test that multiple tasks share a single batched LLM call."""
+        import json
+
+        batched_json = json.dumps({
+            "results": [{"result": "Result A"}, {"result": "Result B"}]
+        })
+        agent, fake = sub_agent_with_fake
+        fake.respond_with(mock_openai_response(batched_json))
+
+        results = agent.execute_tasks(["Task A", "Task B"])
+
+        assert len(results) == 2
+        assert results[0] == {"task": "Task A", "result": "Result A", "status": "completed"}
+        assert results[1] == {"task": "Task B", "result": "Result B", "status": "completed"}
+        assert len(fake.calls) == 1
+
+    def test_execute_tasks_fallback_per_task(self, sub_agent_with_fake, mock_openai_response):
+        """Test that a malformed batched response falls back to per-task calls."""
+        agent, fake = sub_agent_with_fake
+        fake.respond_with(
+            mock_openai_response("not valid json"),
+            mock_openai_response("Result A"),
+            mock_openai_response("Result B")
+        )
+
+        results = agent.execute_tasks(["Task A", "Task B"])
+
+        assert len(results) == 2
+        assert all(r["status"] == "completed" for r in results)
+        # One failed batch call plus one call per task
+        assert len(fake.calls) == 3
+
+    def test_execute_tasks_empty(self, sub_agent_with_fake):
+        """Test that an empty task list makes no LLM call."""
+        agent, fake = sub_agent_with_fake
+
+        assert agent.execute_tasks([]) == []
+        assert fake.calls == []
+
+    def test_execute_task_different_models(self, monkeypatch, mock_api_key):
+        """Test sub-agent with different models."""
+        fake = FakeOpenAI(EMPTY_RESPONSE)
+        monkeypatch.setattr('sub_agent.OpenAI', lambda **kwargs: fake)
 
         # Test with different model
         agent = SubAgent(mock_api_key, "gpt-4")
@@ -89,5 +170,4 @@ class TestSubAgent:
 
         assert result["status"] == "completed"
         # Verify the model was used in the API call
-        call_args = mock_client.chat.completions.create.call_args
-        assert call_args[1]["model"] == "gpt-4"
+        assert fake.calls[0]["model"] == "gpt-4"